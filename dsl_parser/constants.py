@@ -71,6 +71,7 @@ FUNCTION_NAME_PATH_SEPARATOR = '__sep__'
 
 NODES = 'nodes'
 NODE_INSTANCES = 'node_instances'
+DEPLOYMENT_GRAPH_SNAPSHOT = 'deployment_graph_snapshot'
 
 IMPORT_RESOLVER_KEY = 'import_resolver'
 VALIDATE_DEFINITIONS_VERSION = 'validate_definitions_version'
@@ -14,7 +14,9 @@
 #    * limitations under the License.
 
 from dsl_parser import (constants,
-                        models)
+                        functions,
+                        models,
+                        utils)
 from dsl_parser.elements import (imports,
                                  misc,
                                  plugins,
@@ -26,7 +28,7 @@ from dsl_parser.elements import (imports,
                                  data_types,
                                  version as _version)
 from dsl_parser.framework.elements import Element
-from dsl_parser.framework.requirements import Value
+from dsl_parser.framework.requirements import Value, Requirement
 
 
 class BlueprintVersionExtractor(Element):
@@ -86,6 +88,7 @@ class Blueprint(Element):
     }
 
     requires = {
+        'inputs': [Requirement('compact_plan', required=False)],
         node_templates.NodeTemplates: ['deployment_plugins_to_install'],
         workflows.Workflows: ['workflow_plugins_to_install'],
         policies.Policies: ['scaling_groups']
@@ -93,8 +96,9 @@ class Blueprint(Element):
 
     def parse(self, workflow_plugins_to_install,
               deployment_plugins_to_install,
-              scaling_groups):
-        return models.Plan({
+              scaling_groups,
+              compact_plan):
+        plan = models.Plan({
             constants.DESCRIPTION: self.child(misc.Description).value,
             constants.NODES: self.child(node_templates.NodeTemplates).value,
             constants.RELATIONSHIPS: self.child(
@@ -115,3 +119,69 @@ class Blueprint(Element):
             constants.VERSION: self.child(
                 _version.ToscaDefinitionsVersion).value
         })
+        if compact_plan:
+            _compact_plan(plan)
+        return plan
+
+
+def _contains_function(value):
+    # structures containing intrinsic functions are evaluated in place and
+    # therefore must not be shared
+    if isinstance(value, dict):
+        return functions.is_function(value) or any(
+            _contains_function(item) for item in value.itervalues())
+    if isinstance(value, list):
+        return any(_contains_function(item) for item in value)
+    return False
+
+
+class _Interner(object):
+
+    def __init__(self):
+        self._interned = {}
+
+    def __call__(self, value):
+        if _contains_function(value):
+            return value
+        return self._interned.setdefault(utils.freeze(value), value)
+
+    def operations(self, operations):
+        # operations registered under both their short and their
+        # interface qualified names are interned to the same dict
+        return dict((name, self(operation))
+                    for name, operation in operations.iteritems())
+
+    def plugins(self, container, key):
+        if key in container:
+            container[key] = [self(plugin) for plugin in container[key]]
+
+
+def _compact_plan(plan):
+    """Make identical operations, type hierarchies and plugins of the plan
+    share a single instance, to reduce its size in memory (and when
+    pickled or deep copied as a whole, e.g. by prepare_deployment_plan).
+
+    Structures containing intrinsic functions are not shared, the rest of
+    the plan should be treated as read only.
+    """
+    intern = _Interner()
+    for node in plan[constants.NODES]:
+        node[constants.TYPE_HIERARCHY] = intern(
+            node[constants.TYPE_HIERARCHY])
+        node['operations'] = intern.operations(node['operations'])
+        for relationship in node['relationships']:
+            relationship[constants.TYPE_HIERARCHY] = intern(
+                relationship[constants.TYPE_HIERARCHY])
+            for operations in ('source_operations', 'target_operations'):
+                relationship[operations] = intern.operations(
+                    relationship[operations])
+        for plugins_key in (constants.PLUGINS,
+                            constants.PLUGINS_TO_INSTALL,
+                            constants.DEPLOYMENT_PLUGINS_TO_INSTALL):
+            intern.plugins(node, plugins_key)
+    for relationship in plan[constants.RELATIONSHIPS].itervalues():
+        relationship[constants.TYPE_HIERARCHY] = intern(
+            relationship[constants.TYPE_HIERARCHY])
+    for plugins_key in (constants.DEPLOYMENT_PLUGINS_TO_INSTALL,
+                        constants.WORKFLOW_PLUGINS_TO_INSTALL):
+        intern.plugins(plan, plugins_key)
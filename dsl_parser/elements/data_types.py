@@ -184,6 +184,13 @@ class DataType(types.Type):
         for component in component_types:
             merged_component_types.update(component)
         self.component_types.update(merged_component_types)
+        result = self.resolve(
+            lambda: self._parse(super_type, merged_component_types),
+            merged_component_types)
+        self.component_types[self.name] = result
+        return result
+
+    def _parse(self, super_type, merged_component_types):
         result = self.build_dict_result()
         if constants.PROPERTIES not in result:
             result[constants.PROPERTIES] = {}
@@ -193,7 +200,6 @@ class DataType(types.Type):
                 overriding_schema=result.get('properties', {}),
                 data_types=merged_component_types)
         self.fix_properties(result)
-        self.component_types[self.name] = result
         return result
 
     def calculate_provided(self, **kwargs):
@@ -39,7 +39,7 @@ class NodeTemplateType(Element):
     required = True
     schema = Leaf(type=str)
     requires = {
-        _node_types.NodeTypes: [Value('node_types')]
+        _node_types.NodeTypes: [Value('node_types', shared=True)]
     }
 
     def validate(self, node_types):
@@ -56,8 +56,8 @@ class NodeTemplateProperties(Element):
     schema = Leaf(type=dict)
     requires = {
         NodeTemplateType: [],
-        _node_types.NodeTypes: [Value('node_types')],
-        _data_types.DataTypes: [Value('data_types')]
+        _node_types.NodeTypes: [Value('node_types', shared=True)],
+        _data_types.DataTypes: [Value('data_types', shared=True)]
     }
 
     def parse(self, node_types, data_types):
@@ -76,7 +76,8 @@ class NodeTemplateProperties(Element):
                 "value for mandatory "
                 "'{1}' property which is "
                 "part of its type schema"),
-            node_name=self.ancestor(NodeTemplate).name)
+            node_name=self.ancestor(NodeTemplate).name,
+            compiled_schemas=self.ancestor(NodeTemplates).compiled_schemas)
 
 
 class NodeTemplateRelationshipType(Element):
@@ -84,7 +85,7 @@ class NodeTemplateRelationshipType(Element):
     required = True
     schema = Leaf(type=str)
     requires = {
-        _relationships.Relationships: [Value('relationships')]
+        _relationships.Relationships: [Value('relationships', shared=True)]
     }
 
     def validate(self, relationships):
@@ -104,7 +105,7 @@ class NodeTemplateRelationshipTarget(Element):
     def validate(self):
         relationship_type = self.sibling(NodeTemplateRelationshipType).name
         node_name = self.ancestor(NodeTemplate).name
-        node_template_names = self.ancestor(NodeTemplates).initial_value.keys()
+        node_template_names = self.ancestor(NodeTemplates).initial_value_keys
         if self.initial_value not in node_template_names:
             raise exceptions.DSLParsingLogicException(
                 25, "A relationship instance under node '{0}' of type '{1}' "
@@ -124,8 +125,8 @@ class NodeTemplateRelationshipProperties(Element):
     schema = Leaf(type=dict)
     requires = {
         NodeTemplateRelationshipType: [],
-        _relationships.Relationships: [Value('relationships')],
-        _data_types.DataTypes: [Value('data_types')]
+        _relationships.Relationships: [Value('relationships', shared=True)],
+        _data_types.DataTypes: [Value('data_types', shared=True)]
     }
 
     def parse(self, relationships, data_types):
@@ -145,7 +146,8 @@ class NodeTemplateRelationshipProperties(Element):
                 "value for mandatory "
                 "'{1}' property which is "
                 'part of its relationship type schema'),
-            node_name=self.ancestor(NodeTemplate).name)
+            node_name=self.ancestor(NodeTemplate).name,
+            compiled_schemas=self.ancestor(NodeTemplates).compiled_schemas)
 
 
 class NodeTemplateInstancesDeploy(Element):
@@ -344,10 +346,11 @@ class NodeTemplate(Element):
         'self': [Value('related_node_templates',
                        predicate=_node_template_related_nodes_predicate,
                        multiple_results=True)],
-        _plugins.Plugins: [Value('plugins')],
+        _plugins.Plugins: [Value('plugins', shared=True)],
         _node_types.NodeType: [
             Value('node_type',
-                  predicate=_node_template_node_type_predicate)],
+                  predicate=_node_template_node_type_predicate,
+                  shared=True)],
         _node_types.NodeTypes: ['host_types']
     }
 
@@ -361,21 +364,14 @@ class NodeTemplate(Element):
         node.update({
             'name': self.name,
             'id': self.name,
-            constants.TYPE_HIERARCHY: node_type[constants.TYPE_HIERARCHY]
+            constants.TYPE_HIERARCHY: node_type[constants.TYPE_HIERARCHY][:]
         })
 
-        node[constants.INTERFACES] = interfaces_parser.\
-            merge_node_type_and_node_template_interfaces(
-                node_type_interfaces=node_type[constants.INTERFACES],
-                node_template_interfaces=node[constants.INTERFACES])
-
-        node['operations'] = _process_operations(
-            partial_error_message="in node '{0}' of type '{1}'"
-                                  .format(node['id'], node['type']),
-            interfaces=node[constants.INTERFACES],
-            plugins=plugins,
-            error_code=10,
-            resource_base=resource_base)
+        node[constants.INTERFACES], node['operations'] = \
+            self._process_interfaces(node=node,
+                                     node_type=node_type,
+                                     plugins=plugins,
+                                     resource_base=resource_base)
 
         node_name_to_node = dict((node['id'], node)
                                  for node in related_node_templates)
@@ -396,6 +392,57 @@ class NodeTemplate(Element):
 
         return node
 
+    def _process_interfaces(self, node, node_type, plugins, resource_base):
+        # node templates of a type defining the same interfaces (usually
+        # none) share the merging and processing of these, each getting a
+        # copy of the result
+        processed_interfaces = self.parent().processed_interfaces
+        key = (node['type'], utils.freeze(node[constants.INTERFACES]))
+        if key not in processed_interfaces:
+            interfaces = interfaces_parser.\
+                merge_node_type_and_node_template_interfaces(
+                    node_type_interfaces=node_type[constants.INTERFACES],
+                    node_template_interfaces=node[constants.INTERFACES])
+            operations = _process_operations(
+                partial_error_message="in node '{0}' of type '{1}'"
+                                      .format(node['id'], node['type']),
+                interfaces=interfaces,
+                plugins=plugins,
+                error_code=10,
+                resource_base=resource_base)
+            processed_interfaces[key] = (interfaces, operations)
+        interfaces, operations = processed_interfaces[key]
+        return (dict((interface_name, _copy_operations(interface))
+                     for interface_name, interface in interfaces.iteritems()),
+                _copy_operations(operations))
+
+
+def _copy_operations(operations):
+    # an operation listed under more than one name (see
+    # _process_operations) is copied once and stays shared
+    copies = {}
+    result = {}
+    for name, operation in operations.iteritems():
+        operation_copy = copies.get(id(operation))
+        if operation_copy is None:
+            operation_copy = copies[id(operation)] = dict(operation)
+            for key, value in operation.iteritems():
+                if isinstance(value, (dict, list)):
+                    operation_copy[key] = _copy_value(value)
+        result[name] = operation_copy
+    return result
+
+
+def _copy_value(value):
+    # parsed values only nest in dicts and lists, everything else in them
+    # is immutable, so this is a (much cheaper) deep copy
+    if isinstance(value, dict):
+        return dict((key, _copy_value(item))
+                    for key, item in value.iteritems())
+    if isinstance(value, list):
+        return [_copy_value(item) for item in value]
+    return value
+
 
 def _post_process_node_relationships(processed_node,
                                      node_name_to_node,
@@ -476,7 +523,7 @@ class NodeTemplates(Element):
     required = True
     schema = Dict(type=NodeTemplate)
     requires = {
-        _plugins.Plugins: [Value('plugins')],
+        _plugins.Plugins: [Value('plugins', shared=True)],
         _node_types.NodeTypes: ['host_types']
     }
     provides = [
@@ -484,6 +531,15 @@ class NodeTemplates(Element):
         'deployment_plugins_to_install'
     ]
 
+    def __init__(self, *args, **kwargs):
+        super(NodeTemplates, self).__init__(*args, **kwargs)
+        # interfaces and operations of the node templates, by node type
+        # and node template interfaces (see NodeTemplate.parse)
+        self.processed_interfaces = {}
+        # property schemas of the node templates and their relationships,
+        # compiled for merging (see utils.merge_schema_and_instance_properties)
+        self.compiled_schemas = {}
+
     def parse(self, host_types, plugins):
         processed_nodes = dict((node.name, node.value)
                                for node in self.children())
@@ -521,25 +577,34 @@ def _process_nodes_plugins(processed_nodes,
         for rel in node['relationships']:
             node_operations.append(rel['source_operations'])
             nodes_operations[rel['target_id']].append(rel['target_operations'])
+    # plugin records are shared by all nodes using a plugin with the
+    # same executor
+    node_plugins = {}
     for node_name, node in processed_nodes.iteritems():
         node[constants.PLUGINS] = _get_plugins_from_operations(
             operations_lists=nodes_operations[node_name],
-            processed_plugins=plugins)
+            processed_plugins=plugins,
+            node_plugins=node_plugins)
+
+    # accumulate host agent plugins of the nodes contained in each host
+    hosts_plugins_to_install = {}
+    for node in processed_nodes.itervalues():
+        host_id = node.get('host_id')
+        if host_id is None:
+            continue
+        host_plugins_to_install = hosts_plugins_to_install.setdefault(
+            host_id, {})
+        for plugin in node[constants.PLUGINS]:
+            if plugin[constants.PLUGIN_EXECUTOR_KEY] \
+                    == constants.HOST_AGENT:
+                # ok to override here since we assume it is the same plugin
+                host_plugins_to_install[plugin['name']] = plugin
 
     for node in processed_nodes.itervalues():
         # set plugins_to_install property for nodes
         if node['type'] in host_types:
-            plugins_to_install = {}
-            for another_node in processed_nodes.itervalues():
-                # going over all other nodes, to accumulate plugins
-                # from different nodes whose host is the current node
-                if another_node.get('host_id') == node['id']:
-                    # ok to override here since we assume it is the same plugin
-                    for plugin in another_node[constants.PLUGINS]:
-                        if plugin[constants.PLUGIN_EXECUTOR_KEY] \
-                                == constants.HOST_AGENT:
-                            plugins_to_install[plugin['name']] = plugin
-            node[constants.PLUGINS_TO_INSTALL] = plugins_to_install.values()
+            node[constants.PLUGINS_TO_INSTALL] = hosts_plugins_to_install.get(
+                node['id'], {}).values()
 
         # set deployment_plugins_to_install property for nodes
         deployment_plugins_to_install = {}
@@ -554,7 +619,8 @@ def _process_nodes_plugins(processed_nodes,
 
 
 def _get_plugins_from_operations(operations_lists,
-                                 processed_plugins):
+                                 processed_plugins,
+                                 node_plugins):
     plugins = {}
     for operations in operations_lists:
         for operation in operations.values():
@@ -562,13 +628,14 @@ def _get_plugins_from_operations(operations_lists,
             if not plugin_name:
                 # no-op
                 continue
-            plugin = processed_plugins[plugin_name]
             operation_executor = operation['executor']
             plugin_key = (plugin_name, operation_executor)
             if plugin_key not in plugins:
-                plugin = copy.deepcopy(plugin)
-                plugin['executor'] = operation_executor
-                plugins[plugin_key] = plugin
+                if plugin_key not in node_plugins:
+                    plugin = copy.deepcopy(processed_plugins[plugin_name])
+                    plugin['executor'] = operation_executor
+                    node_plugins[plugin_key] = plugin
+                plugins[plugin_key] = node_plugins[plugin_key]
     return plugins.values()
 
 
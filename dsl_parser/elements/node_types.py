@@ -35,10 +35,14 @@ class NodeType(types.Type):
         'self': [requirements.Value('super_type',
                                     predicate=types.derived_from_predicate,
                                     required=False)],
-        _data_types.DataTypes: [requirements.Value('data_types')]
+        _data_types.DataTypes: [requirements.Value('data_types', shared=True)]
     }
 
     def parse(self, super_type, data_types):
+        return self.resolve(
+            lambda: self._parse(super_type, data_types), data_types)
+
+    def _parse(self, super_type, data_types):
         node_type = self.build_dict_result()
         if not node_type.get('derived_from'):
             node_type.pop('derived_from', None)
@@ -214,8 +214,7 @@ def process_operation(
         else:
             return no_op_operation(operation_name=operation_name)
 
-    candidate_plugins = [p for p in plugins.keys()
-                         if operation_mapping.startswith('{0}.'.format(p))]
+    candidate_plugins = _candidate_plugins(plugins, operation_mapping)
     if candidate_plugins:
         if len(candidate_plugins) > 1:
             raise exceptions.DSLParsingLogicException(
@@ -302,6 +301,20 @@ def process_operation(
         raise exceptions.DSLParsingLogicException(error_code, error_message)
 
 
+def _candidate_plugins(plugins, operation_mapping):
+    # the plugins a mapping may refer to are the ones named like one of
+    # its dotted prefixes, so these are looked up rather than matching
+    # the mapping against every plugin name
+    candidate_plugins = []
+    dot = operation_mapping.find('.')
+    while dot != -1:
+        prefix = operation_mapping[:dot]
+        if prefix in plugins:
+            candidate_plugins.append(prefix)
+        dot = operation_mapping.find('.', dot + 1)
+    return candidate_plugins
+
+
 def _resource_exists(resource_bases, resource_name):
     return any(utils.url_exists('{0}/{1}'.format(resource_base, resource_name))
                for resource_base in resource_bases if resource_base)
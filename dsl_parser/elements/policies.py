@@ -13,10 +13,6 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
-import itertools
-
-import networkx as nx
-
 from dsl_parser import (exceptions,
                         utils,
                         constants)
@@ -94,8 +90,8 @@ class GroupPolicyProperties(Element):
     schema = Leaf(type=dict)
     requires = {
         GroupPolicyType: [],
-        PolicyTypes: [Value('policy_types')],
-        data_types.DataTypes: [Value('data_types')]
+        PolicyTypes: [Value('policy_types', shared=True)],
+        data_types.DataTypes: [Value('data_types', shared=True)]
     }
 
     def parse(self, policy_types, data_types):
@@ -112,7 +108,8 @@ class GroupPolicyProperties(Element):
             "part of its policy type schema",
             node_name="group '{0}', policy '{1}'".format(
                 self.ancestor(Group).name,
-                self.ancestor(GroupPolicy).name))
+                self.ancestor(GroupPolicy).name),
+            compiled_schemas=self.ancestor(Groups).compiled_schemas)
 
 
 class GroupPolicyTriggerType(Element):
@@ -141,8 +138,8 @@ class GroupPolicyTriggerParameters(Element):
     schema = Leaf(type=dict)
     requires = {
         GroupPolicyTriggerType: [],
-        PolicyTriggers: [Value('policy_triggers')],
-        data_types.DataTypes: [Value('data_types')]
+        PolicyTriggers: [Value('policy_triggers', shared=True)],
+        data_types.DataTypes: [Value('data_types', shared=True)]
     }
 
     def parse(self, policy_triggers, data_types):
@@ -161,7 +158,8 @@ class GroupPolicyTriggerParameters(Element):
             node_name="group '{0}', policy '{1}' trigger '{2}'"
                       .format(self.ancestor(Group).name,
                               self.ancestor(GroupPolicy).name,
-                              self.ancestor(GroupPolicyTrigger).name))
+                              self.ancestor(GroupPolicyTrigger).name),
+            compiled_schemas=self.ancestor(Groups).compiled_schemas)
 
 
 class GroupPolicyTrigger(DictElement):
@@ -194,9 +192,8 @@ class GroupMember(Element):
     }
 
     def validate(self, node_template_names):
-        groups = self.ancestor(Groups).initial_value
+        group_names = self.ancestor(Groups).initial_value_keys
         value = self.initial_value
-        group_names = set(groups.keys()) if groups else set()
         if value not in node_template_names and value not in group_names:
             raise exceptions.DSLParsingLogicException(
                 40,
@@ -248,6 +245,12 @@ class Groups(DictElement):
 
     schema = Dict(type=Group)
 
+    def __init__(self, *args, **kwargs):
+        super(Groups, self).__init__(*args, **kwargs)
+        # property schemas of the group policies and their triggers,
+        # compiled for merging (see utils.merge_schema_and_instance_properties)
+        self.compiled_schemas = {}
+
 
 class PolicyInstanceType(Element):
 
@@ -352,125 +355,119 @@ class Policies(DictElement):
 
     def _validate_and_update_groups(self, scaling_groups, node_templates):
 
-        member_graph = nx.DiGraph()
+        # the groups each member (node or group) is a direct member of
+        member_groups = {}
         for group_name, group in scaling_groups.items():
+            member_groups.setdefault(group_name, [])
             for member in group['members']:
-                member_graph.add_edge(member, group_name)
+                groups = member_groups.setdefault(member, [])
+                if group_name not in groups:
+                    groups.append(group_name)
 
-        node_graph = nx.DiGraph()
+        # the node each node is directly contained in (None if it is not)
+        node_containers = {}
         for node in node_templates:
-            node_graph.add_node(node['id'])
+            node_containers[node['id']] = None
             for rel in node.get(constants.RELATIONSHIPS, []):
                 if constants.CONTAINED_IN_REL_TYPE in rel['type_hierarchy']:
-                    node_graph.add_edge(node['id'], rel['target_id'])
-
-        self._validate_no_group_cycles(member_graph)
-        self._validate_members_in_one_group_only(member_graph)
+                    node_containers[node['id']] = rel['target_id']
+                    break
+
+        self._validate_no_group_cycles(member_groups)
+        self._validate_members_in_one_group_only(member_groups)
+        # from here on, every member is a direct member of one group at most
+        member_group = dict((member, groups[0] if groups else None)
+                            for member, groups in member_groups.iteritems())
         self._validate_no_contained_in_shares_group_with_non_contained_in(
-            member_graph, node_graph)
+            member_group, node_containers)
         self._remove_contained_nodes_from_scaling_groups(
-            scaling_groups, member_graph, node_graph)
+            scaling_groups, member_group, node_containers)
 
     @staticmethod
-    def _validate_no_group_cycles(member_graph):
+    def _validate_no_group_cycles(member_groups):
         # verify no group cycles (i.e. group A in group B and vice versa)
-        group_cycles = nx.recursive_simple_cycles(member_graph)
-        if group_cycles:
-            raise exceptions.DSLParsingLogicException(
-                exceptions.ERROR_GROUP_CYCLE,
-                'Illegal group cycles found: {0}'.format(group_cycles))
+        # with an iterative depth first search over the member -> group edges
+        visited = set()
+        for root in member_groups:
+            if root in visited:
+                continue
+            visited.add(root)
+            path = [root]
+            on_path = set(path)
+            stack = [iter(member_groups[root])]
+            while stack:
+                group = next(stack[-1], None)
+                if group is None:
+                    stack.pop()
+                    on_path.remove(path.pop())
+                elif group in on_path:
+                    group_cycle = path[path.index(group):]
+                    raise exceptions.DSLParsingLogicException(
+                        exceptions.ERROR_GROUP_CYCLE,
+                        'Illegal group cycles found: {0}'.format(
+                            [group_cycle]))
+                elif group not in visited:
+                    visited.add(group)
+                    path.append(group)
+                    on_path.add(group)
+                    stack.append(iter(member_groups[group]))
 
     @staticmethod
-    def _validate_members_in_one_group_only(member_graph):
+    def _validate_members_in_one_group_only(member_groups):
         # verify all group members are part of exactly one group
-        for member in member_graph:
-            successors = member_graph.successors(member)
-            if len(successors) > 1:
+        for member, groups in member_groups.iteritems():
+            if len(groups) > 1:
                 raise exceptions.DSLParsingLogicException(
                     exceptions.ERROR_MULTIPLE_GROUPS,
                     "Nodes and groups cannot be members in multiple groups, "
                     "but member '{0}' belongs to the following multiple "
-                    "groups: {1}".format(member, successors))
+                    "groups: {1}".format(member, groups))
 
     @staticmethod
     def _validate_no_contained_in_shares_group_with_non_contained_in(
-            member_graph, node_graph):
+            member_group, node_containers):
         # for each node a, if node a is (recursively) contained in node b
         # verify that it is not contained in (recursively) a group that has
         # nodes that are not (recursively) contained in node b too unless
-        # node b is in that group as well
-
-        # first extract all group members (recursively)
-        group_members = {}
-        for member in member_graph:
-            if member in node_graph:
+        # node b is in that group as well.
+        # two nodes sharing a group are fine if they have the same root
+        # containing node, or are both not contained in any node. otherwise,
+        # they are fine only if an ancestor node of one of them is fine with
+        # the other, which (as group members sharing some group are exactly
+        # the node members of the same top level group) holds if and only
+        # if the root containing nodes of both are members of that top level
+        # group too.
+
+        # first, group the node members (recursively) by their top level
+        # group, and these by their root containing node
+        top_level_groups = {}
+        for member in member_group:
+            if member not in node_containers:
                 continue
-            group_members[member] = nx.ancestors(member_graph, member)
-
-        # next, remove members that are groups themselves
-        group_names = set(group_members.keys())
-        group_node_members = {}
-        for group_name, members in group_members.items():
-            group_node_members[group_name] = members - group_names
-
-        # now, for each group, for each node pair, verify both nodes in pair
-        # are contained (recursively) in some third node or one of them is
-        # contained in some third node that has this property
-        containing_nodes = {}
-
-        def check_pair(pair_key):
-            node_a, node_b = pair_key
-            if node_a == node_b:
-                return True
-            if node_a not in containing_nodes:
-                containing_nodes[node_a] = nx.topological_sort(
-                    node_graph, nbunch=[node_a])
-            if node_b not in containing_nodes:
-                containing_nodes[node_b] = nx.topological_sort(
-                    node_graph, nbunch=[node_b])
-            a_containing_nodes = set(containing_nodes[node_a])
-            a_containing_nodes.remove(node_a)
-            b_containing_nodes = set(containing_nodes[node_b])
-            b_containing_nodes.remove(node_b)
-            if not (a_containing_nodes or b_containing_nodes):
-                return True
-            if node_b in a_containing_nodes:
-                return True
-            if node_a in b_containing_nodes:
-                return True
-            if a_containing_nodes & b_containing_nodes:
-                return True
-            return False
-
-        checked_pairs = set()
-        ok_pairs = set()
-        problematic_pairs = set()
-        for node_members in group_node_members.values():
-            for node_a, node_b in itertools.product(node_members, repeat=2):
-                pair_key = tuple(sorted([node_a, node_b]))
-                if pair_key in checked_pairs:
+            top_level_group = _top_level_group(member, member_group)
+            if top_level_group is None:
+                continue
+            root = _containing_nodes(member, node_containers)[-1]
+            top_level_groups.setdefault(top_level_group, {}).setdefault(
+                root, set()).add(member)
+
+        # next, verify the root containing nodes of the members of each top
+        # level group spanning more than a single root are members as well
+        for top_level_group in sorted(top_level_groups):
+            root_members = top_level_groups[top_level_group]
+            if len(root_members) < 2:
+                continue
+            for root in sorted(root_members):
+                if root in root_members[root]:
                     continue
-                if check_pair(pair_key):
-                    ok_pairs.add(pair_key)
-                else:
-                    problematic_pairs.add(pair_key)
-                checked_pairs.add(pair_key)
-
-        def check_problematic_pair(node_a, node_b):
-            for node_a_containing_node in containing_nodes[node_a]:
-                pair_key = tuple(sorted([node_b, node_a_containing_node]))
-                if pair_key in ok_pairs:
-                    return True
-            for node_b_containing_node in containing_nodes[node_b]:
-                pair_key = tuple(sorted([node_a, node_b_containing_node]))
-                if pair_key in ok_pairs:
-                    return True
-            return False
-
-        for node_a, node_b in problematic_pairs:
-            if check_problematic_pair(node_a, node_b):
-                ok_pairs.add((node_a, node_b))
-            else:
+                # some member of this root is contained in it and shares the
+                # group with a member of another root
+                node_a = sorted(root_members[root])[0]
+                node_b = sorted(member for other_root, members
+                                in root_members.iteritems()
+                                if other_root != root
+                                for member in members)[0]
+                node_a, node_b = sorted([node_a, node_b])
                 raise exceptions.DSLParsingLogicException(
                     exceptions.ERROR_NON_CONTAINED_GROUP_MEMBERS,
                     "Node '{0}' and '{1}' belong to some shared group but "
@@ -479,37 +476,34 @@ class Policies(DictElement):
 
     @staticmethod
     def _remove_contained_nodes_from_scaling_groups(
-            scaling_groups, member_graph, node_graph):
+            scaling_groups, member_group, node_containers):
         # for each node, if a node is (recursively) with
         # a node that contains it (recursively), remove the offending
         # member from the relevant group.
         # if the node and its containee are in the same group, remove the
         # containee, otherwise, remove the group closest to the containing
         # node
-        for member in member_graph:
-            if member not in node_graph:
+        for member in member_group:
+            if member not in node_containers:
                 continue
-            containing_groups = nx.topological_sort(member_graph,
-                                                    nbunch=[member])
-            containing_nodes = nx.topological_sort(node_graph, nbunch=[member])
-            for node in containing_nodes:
-                if node == member:
-                    continue
-                if node not in member_graph:
+            containing_groups = _containing_groups(member, member_group)
+            containing_nodes = _containing_nodes(member, node_containers)
+            for node in containing_nodes[1:]:
+                if node not in member_group:
                     continue
 
-                containing_node_groups = nx.topological_sort(member_graph,
-                                                             nbunch=[node])
-                containing_node_groups_set = set(containing_node_groups)
+                containing_node_groups_set = set(
+                    _containing_groups(node, member_group))
 
-                shared_groups = (set(containing_groups) &
-                                 containing_node_groups_set)
+                # the groups shared with the containing node are the
+                # topmost groups of the member, from the minimal one up
+                shared_groups = [group for group in containing_groups
+                                 if group in containing_node_groups_set]
                 if not shared_groups:
                     continue
 
-                minimal_containing_group = nx.topological_sort(
-                    member_graph, nbunch=shared_groups)[0]
-                direct_member_group = member_graph.successors(member)[0]
+                minimal_containing_group = shared_groups[0]
+                direct_member_group = containing_groups[1]
                 members = scaling_groups[minimal_containing_group]['members']
                 if direct_member_group == minimal_containing_group:
                     removed_member = member
@@ -523,3 +517,33 @@ class Policies(DictElement):
 
                 if removed_member in members:
                     members.remove(removed_member)
+
+
+def _containing_groups(member, member_group):
+    # the member followed by the groups it is (recursively) a member of,
+    # closest first
+    containing_groups = [member]
+    group = member_group.get(member)
+    while group is not None:
+        containing_groups.append(group)
+        group = member_group.get(group)
+    return containing_groups
+
+
+def _top_level_group(member, member_group):
+    containing_groups = _containing_groups(member, member_group)
+    return containing_groups[-1] if len(containing_groups) > 1 else None
+
+
+def _containing_nodes(node, node_containers):
+    # the node followed by the nodes it is (recursively) contained in,
+    # closest first
+    containing_nodes = [node]
+    visited = set(containing_nodes)
+    container = node_containers.get(node)
+    # contained in cycles are reported when building the plan node graph
+    while container is not None and container not in visited:
+        containing_nodes.append(container)
+        visited.add(container)
+        container = node_containers.get(container)
+    return containing_nodes
@@ -34,14 +34,24 @@ class Relationship(types.Type):
     }
     requires = {
         'inputs': [Requirement('resource_base', required=False)],
-        _plugins.Plugins: [Value('plugins')],
+        _plugins.Plugins: [Value('plugins', shared=True)],
         'self': [Value('super_type',
                        predicate=types.derived_from_predicate,
                        required=False)],
-        _data_types.DataTypes: [Value('data_types')]
+        _data_types.DataTypes: [Value('data_types', shared=True)]
     }
 
     def parse(self, super_type, plugins, resource_base, data_types):
+        relationship_type = self.resolve(
+            lambda: self._parse(super_type, data_types), data_types)
+        _validate_relationship_fields(
+            rel_obj=relationship_type,
+            plugins=plugins,
+            rel_name=self.name,
+            resource_base=resource_base)
+        return relationship_type
+
+    def _parse(self, super_type, data_types):
         relationship_type = self.build_dict_result()
         if not relationship_type.get('derived_from'):
             relationship_type.pop('derived_from', None)
@@ -59,11 +69,6 @@ class Relationship(types.Type):
                         overriding_interfaces=relationship_type[interfaces],
                         overridden_interfaces=super_type[interfaces])
 
-        _validate_relationship_fields(
-            rel_obj=relationship_type,
-            plugins=plugins,
-            rel_name=relationship_type_name,
-            resource_base=resource_base)
         relationship_type['name'] = relationship_type_name
         relationship_type[
             constants.TYPE_HIERARCHY] = self.create_type_hierarchy(super_type)
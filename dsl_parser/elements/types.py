@@ -13,18 +13,89 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
+import collections
+import threading
+
+from dsl_parser import constants
 from dsl_parser import exceptions
+from dsl_parser import utils
 from dsl_parser.framework.elements import (DictElement,
                                            Element,
                                            Leaf)
 
 
+# Fully resolved types, keyed by everything their resolution depends on,
+# so type libraries imported by many blueprints can be resolved once per
+# process. Disabled by default, set the size to a positive number of types
+# to enable it. Least recently used entries are evicted first.
+RESOLVED_TYPES_CACHE_SIZE = 0
+_resolved_types = collections.OrderedDict()
+_resolved_types_lock = threading.Lock()
+
+
 class Types(DictElement):
-    pass
+
+    def __init__(self, *args, **kwargs):
+        super(Types, self).__init__(*args, **kwargs)
+        # resolution keys of the types resolved so far, by type name, so
+        # that each type only needs its super type's key to compute its own.
+        self.resolution_keys = {}
 
 
 class Type(Element):
 
+    def resolve(self, parse_type, data_types):
+        """Return the resolved type, calling parse_type() only if an
+        identical type (same definition, same ancestor chain and same
+        referenced data types) was resolved before while the resolved
+        types cache is enabled (see RESOLVED_TYPES_CACHE_SIZE).
+
+        The returned value may be shared with other parses. Like any
+        parsed value it is also handed as is to the elements requiring it
+        as a shared value (see framework.requirements.Value), so it must
+        not be modified.
+        """
+        if RESOLVED_TYPES_CACHE_SIZE <= 0:
+            return parse_type()
+        key = self._resolution_key(data_types)
+        with _resolved_types_lock:
+            resolved = _resolved_types.pop(key, None)
+        if resolved is None:
+            resolved = parse_type()
+        with _resolved_types_lock:
+            _resolved_types[key] = resolved
+            while len(_resolved_types) > RESOLVED_TYPES_CACHE_SIZE:
+                _resolved_types.popitem(last=False)
+        return resolved
+
+    def _resolution_key(self, data_types):
+        keys = self.parent().resolution_keys
+        definition = self._initial_value or {}
+        super_type_name = definition.get(constants.DERIVED_FROM)
+        referenced = {}
+        pending = [prop.get('type') for prop in
+                   (definition.get(constants.PROPERTIES) or {}).itervalues()
+                   if isinstance(prop, dict)]
+        while pending:
+            type_name = pending.pop()
+            if type_name in referenced or type_name not in data_types:
+                continue
+            data_type = data_types[type_name]
+            referenced[type_name] = data_type
+            pending.append(data_type.get(constants.DERIVED_FROM))
+            pending.extend(prop.get('type') for prop in
+                           data_type.get(constants.PROPERTIES, {})
+                           .itervalues())
+        # frozen values keep the types of keys and scalars, so e.g.
+        # {1: a} and {'1': a} are different keys
+        key = (type(self).__name__,
+               self.name,
+               utils.freeze(definition),
+               keys.get(super_type_name),
+               utils.freeze(referenced))
+        keys[self.name] = key
+        return key
+
     def create_type_hierarchy(self, super_type):
         if super_type:
             type_hierarchy = super_type['type_hierarchy'][:]
@@ -48,7 +119,7 @@ class DerivedFrom(Element):
         if self.initial_value is None:
             return
 
-        if self.initial_value not in self.ancestor(Types).initial_value:
+        if self.initial_value not in self.ancestor(Types).initial_value_keys:
             raise exceptions.DSLParsingLogicException(
                 exceptions.ERROR_UNKNOWN_TYPE,
                 "Missing definition for {0} '{1}' which is declared as "
@@ -13,6 +13,8 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
+import copy
+
 from dsl_parser.elements import (data_types,
                                  plugins as _plugins,
                                  operation)
@@ -41,7 +43,7 @@ class Workflow(Element):
     ]
     requires = {
         'inputs': [Requirement('resource_base', required=False)],
-        _plugins.Plugins: [Value('plugins')]
+        _plugins.Plugins: [Value('plugins', shared=True)]
     }
 
     def parse(self, plugins, resource_base):
@@ -64,7 +66,7 @@ class Workflows(DictElement):
 
     schema = Dict(type=Workflow)
     requires = {
-        _plugins.Plugins: [Value('plugins')]
+        _plugins.Plugins: [Value('plugins', shared=True)]
     }
     provides = ['workflow_plugins_to_install']
 
@@ -74,7 +76,8 @@ class Workflows(DictElement):
         for workflow, op_struct in self.value.items():
             if op_struct['plugin'] not in workflow_plugin_names:
                 plugin_name = op_struct['plugin']
-                workflow_plugins.append(plugins[plugin_name])
+                # plugins is shared (see Value), parts of it are not provided
+                workflow_plugins.append(copy.deepcopy(plugins[plugin_name]))
                 workflow_plugin_names.add(plugin_name)
         return {
             'workflow_plugins_to_install': workflow_plugins
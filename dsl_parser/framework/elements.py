@@ -71,6 +71,7 @@ class Element(object):
         self.name_end_column = name.end_column
         self._parsed_value = UNPARSED
         self._provided = None
+        self._initial_value_keys = None
 
     def __str__(self):
         message = StringIO()
@@ -103,13 +104,31 @@ class Element(object):
     def initial_value(self):
         return copy.deepcopy(self._initial_value)
 
+    @property
+    def initial_value_keys(self):
+        """The keys of the initial value (empty if it is not a dict),
+        computed once, e.g. for descendants validating names against the
+        entries of a section without copying the whole section."""
+        if self._initial_value_keys is None:
+            if isinstance(self._initial_value, dict):
+                self._initial_value_keys = frozenset(self._initial_value)
+            else:
+                self._initial_value_keys = frozenset()
+        return self._initial_value_keys
+
     @property
     def value(self):
+        return copy.deepcopy(self.shared_value)
+
+    @property
+    def shared_value(self):
+        """The parsed value itself rather than a copy of it, not to be
+        modified (see requirements.Value)."""
         if self._parsed_value == UNPARSED:
             raise exceptions.DSLParsingSchemaAPIException(
                 exceptions.ERROR_CODE_ILLEGAL_VALUE_ACCESS,
                 'Cannot access element value before parsing')
-        return copy.deepcopy(self._parsed_value)
+        return self._parsed_value
 
     @value.setter
     def value(self, val):
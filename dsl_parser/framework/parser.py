@@ -367,7 +367,9 @@ class Parser(object):
                         if requirement.predicate and not requirement.predicate(
                                 element, required_element):
                             continue
-                        if requirement.parsed:
+                        if requirement.shared:
+                            result.append(required_element.shared_value)
+                        elif requirement.parsed:
                             result.append(required_element.value)
                         else:
                             if (requirement.name not in
@@ -16,6 +16,8 @@
 
 class Requirement(object):
 
+    shared = False
+
     def __init__(self,
                  name,
                  parsed=False,
@@ -30,17 +32,27 @@ class Requirement(object):
 
 
 class Value(Requirement):
+    """
+    A requirement for the parsed value of an element.
+
+    :param shared: When True, the consumer gets the parsed value itself
+                   rather than a deep copy of it, and must not modify it (or
+                   return parts of it in its own value). All consumers of a
+                   shared value share the same instance.
+    """
 
     def __init__(self,
                  name,
                  multiple_results=False,
                  required=True,
-                 predicate=None):
+                 predicate=None,
+                 shared=False):
         super(Value, self).__init__(name,
                                     parsed=True,
                                     multiple_results=multiple_results,
                                     required=required,
                                     predicate=predicate)
+        self.shared = shared
 
 
 def sibling_predicate(source, target):
@@ -15,6 +15,7 @@
 
 import pkg_resources
 import abc
+from multiprocessing.pool import ThreadPool
 
 from dsl_parser import (constants,
                         exceptions,
@@ -63,6 +64,8 @@ class RuntimeEvaluationStorage(object):
         self._node_to_node_instances = {}
         self._node_instances = {}
         self._nodes = {}
+        self._parent_node_instance_ids = {}
+        self._scaling_groups_index = {}
 
     def get_node_instances(self, node_id):
         if node_id not in self._node_to_node_instances:
@@ -84,6 +87,90 @@ class RuntimeEvaluationStorage(object):
             self._nodes[node_id] = node
         return self._nodes[node_id]
 
+    def get_parent_node_instance(self, node_instance):
+        """Returns the node instance containing the given node instance
+        (or None), memoized for the lifetime of this storage."""
+        node_instance_id = node_instance.id
+        if node_instance_id not in self._parent_node_instance_ids:
+            parent_id = None
+            node = self.get_node(node_instance.node_id)
+            for relationship in node.relationships or []:
+                if (constants.CONTAINED_IN_REL_TYPE in
+                        relationship['type_hierarchy']):
+                    target_name = relationship['target_id']
+                    parent_id = [
+                        r['target_id'] for r in node_instance.relationships
+                        if r['target_name'] == target_name][0]
+                    break
+            self._parent_node_instance_ids[node_instance_id] = parent_id
+        parent_id = self._parent_node_instance_ids[node_instance_id]
+        if parent_id is None:
+            return None
+        return self.get_node_instance(parent_id)
+
+    def get_scaling_groups_index(self, node_instance):
+        """Returns the scaling groups containing the given node instance,
+        either directly or through its containing node instances.
+
+        The result is a tuple of a list of group names ordered from the
+        innermost group outwards and a dict mapping each group name to the
+        id of the group instance containing the node instance. Results are
+        memoized per node instance so that all functions evaluated using
+        this storage share them.
+        """
+        node_instance_id = node_instance.id
+        if node_instance_id not in self._scaling_groups_index:
+            group_names = []
+            group_ids = {}
+            for scaling_group in node_instance.scaling_groups or []:
+                group_names.append(scaling_group['name'])
+                group_ids.setdefault(scaling_group['name'],
+                                     scaling_group['id'])
+            parent_instance = self.get_parent_node_instance(node_instance)
+            if parent_instance:
+                parent_group_names, parent_group_ids = \
+                    self.get_scaling_groups_index(parent_instance)
+                for group_name in parent_group_names:
+                    group_names.append(group_name)
+                    group_ids.setdefault(group_name,
+                                         parent_group_ids[group_name])
+            self._scaling_groups_index[node_instance_id] = (group_names,
+                                                            group_ids)
+        return self._scaling_groups_index[node_instance_id]
+
+    def prefetch(self, node_ids, node_instance_ids, pool):
+        """Fetches the instances of the given nodes, the given node
+        instances and then the nodes of all fetched node instances using
+        the given pool, so that the latency of independent storage calls
+        overlaps."""
+        node_ids = [node_id for node_id in set(node_ids)
+                    if node_id not in self._node_to_node_instances]
+        node_instance_ids = [
+            node_instance_id for node_instance_id in set(node_instance_ids)
+            if node_instance_id not in self._node_instances]
+        node_instances_result = pool.map_async(
+            self._get_node_instances_method, node_ids)
+        node_instance_result = pool.map_async(
+            self._get_node_instance_method, node_instance_ids)
+        for node_id, node_instances in zip(node_ids,
+                                           node_instances_result.get()):
+            self._node_to_node_instances[node_id] = node_instances
+            for node_instance in node_instances:
+                self._node_instances[node_instance.id] = node_instance
+        for node_instance_id, node_instance in zip(
+                node_instance_ids, node_instance_result.get()):
+            self._node_instances[node_instance_id] = node_instance
+
+        instances_node_ids = [
+            node_id for node_id in set(
+                node_instance.node_id
+                for node_instance in self._node_instances.values())
+            if node_id not in self._nodes]
+        for node_id, node in zip(instances_node_ids,
+                                 pool.map(self._get_node_method,
+                                          instances_node_ids)):
+            self._nodes[node_id] = node
+
 
 class Function(object):
 
@@ -345,28 +432,11 @@ class GetAttribute(Function):
             storage,
             node_instances):
 
-        def _parent_instance(_instance):
-            _node = storage.get_node(_instance.node_id)
-            for relationship in _node.relationships or []:
-                if (constants.CONTAINED_IN_REL_TYPE in
-                        relationship['type_hierarchy']):
-                    target_name = relationship['target_id']
-                    target_id = [
-                        r['target_id'] for r in _instance.relationships
-                        if r['target_name'] == target_name][0]
-                    return storage.get_node_instance(target_id)
-            return None
-
-        def _containing_groups(_instance):
-            result = [g['name'] for g in _instance.scaling_groups or []]
-            parent_instance = _parent_instance(_instance)
-            if parent_instance:
-                result += _containing_groups(parent_instance)
-            return result
-
         def _minimal_shared_group(instance_a, instance_b):
-            a_containing_groups = _containing_groups(instance_a)
-            b_containing_groups = _containing_groups(instance_b)
+            a_containing_groups, _ = storage.get_scaling_groups_index(
+                instance_a)
+            b_containing_groups, _ = storage.get_scaling_groups_index(
+                instance_b)
             shared_groups = set(a_containing_groups) & set(b_containing_groups)
             if not shared_groups:
                 return None
@@ -377,13 +447,10 @@ class GetAttribute(Function):
                 raise RuntimeError('Illegal state')
 
         def _group_instance(node_instance, group_name):
-            for scaling_group in (node_instance.scaling_groups or []):
-                if scaling_group['name'] == group_name:
-                    return scaling_group['id']
-            parent_instance = _parent_instance(node_instance)
-            if not parent_instance:
+            _, group_ids = storage.get_scaling_groups_index(node_instance)
+            if group_name not in group_ids:
                 raise RuntimeError('Illegal state')
-            return _group_instance(parent_instance, group_name)
+            return group_ids[group_name]
 
         def _resolve_node_instance(context_instance_id):
             context_instance = storage.get_node_instance(context_instance_id)
@@ -533,6 +600,13 @@ def _get_property_value(node_name,
     return value
 
 
+def is_function(value):
+    """Returns whether the value is an intrinsic function definition, i.e.
+    a single key dict whose key is a registered function name."""
+    return (isinstance(value, dict) and len(value) == 1 and
+            next(value.iterkeys()) in TEMPLATE_FUNCTIONS)
+
+
 def parse(raw_function, scope=None, context=None, path=None):
     if isinstance(raw_function, dict) and len(raw_function) == 1:
         func_name = raw_function.keys()[0]
@@ -549,7 +623,8 @@ def parse(raw_function, scope=None, context=None, path=None):
 def evaluate_functions(payload, context,
                        get_node_instances_method,
                        get_node_instance_method,
-                       get_node_method):
+                       get_node_method,
+                       max_concurrent_fetches=None):
     """Evaluate functions in payload.
 
     :param payload: The payload to evaluate.
@@ -557,30 +632,46 @@ def evaluate_functions(payload, context,
     :param get_node_instances_method: A method for getting node instances.
     :param get_node_instance_method: A method for getting a node instance.
     :param get_node_method: A method for getting a node.
+    :param max_concurrent_fetches: If greater than 1, the nodes and node
+                                   instances referenced by the payload are
+                                   fetched up front using up to this many
+                                   concurrent calls to the provided methods
+                                   (which must be thread safe).
     :return: payload.
     """
-    handler = runtime_evaluation_handler(get_node_instances_method,
-                                         get_node_instance_method,
-                                         get_node_method)
+    storage = RuntimeEvaluationStorage(
+        get_node_instances_method=get_node_instances_method,
+        get_node_instance_method=get_node_instance_method,
+        get_node_method=get_node_method)
+    if max_concurrent_fetches and max_concurrent_fetches > 1:
+        _prefetch_runtime_references(payload,
+                                     context=context,
+                                     storage=storage,
+                                     max_concurrent_fetches=(
+                                         max_concurrent_fetches))
+    handler = _handler('evaluate_runtime', storage=storage)
     scan.scan_properties(payload,
                          handler,
                          scope=None,
                          context=context,
                          path='payload',
-                         replace=True)
+                         replace=True,
+                         value_filter=is_function)
     return payload
 
 
 def evaluate_outputs(outputs_def,
                      get_node_instances_method,
                      get_node_instance_method,
-                     get_node_method):
+                     get_node_method,
+                     max_concurrent_fetches=None):
     """Evaluates an outputs definition containing intrinsic functions.
 
     :param outputs_def: Outputs definition.
     :param get_node_instances_method: A method for getting node instances.
     :param get_node_instance_method: A method for getting a node instance.
     :param get_node_method: A method for getting a node.
+    :param max_concurrent_fetches: See ``evaluate_functions``.
     :return: Outputs dict.
     """
     outputs = dict((k, v['value']) for k, v in outputs_def.iteritems())
@@ -589,7 +680,53 @@ def evaluate_outputs(outputs_def,
         context={},
         get_node_instances_method=get_node_instances_method,
         get_node_instance_method=get_node_instance_method,
-        get_node_method=get_node_method)
+        get_node_method=get_node_method,
+        max_concurrent_fetches=max_concurrent_fetches)
+
+
+def _prefetch_runtime_references(payload,
+                                 context,
+                                 storage,
+                                 max_concurrent_fetches):
+    context_refs = {
+        SELF: context.get('self'),
+        SOURCE: context.get('source'),
+        TARGET: context.get('target')
+    }
+    node_ids = set()
+    node_instance_ids = set()
+
+    def handler(v, scope, context, path):
+        func = parse(v, scope=scope, context=context, path=path)
+        if not isinstance(func, GetAttribute):
+            return v
+        if func.node_name in context_refs:
+            node_instance_id = context_refs[func.node_name]
+            if node_instance_id:
+                node_instance_ids.add(node_instance_id)
+        else:
+            node_ids.add(func.node_name)
+            # ambiguity resolution starts from the context node instances
+            node_instance_ids.update(
+                i for i in context_refs.values() if i)
+        return v
+
+    scan.scan_properties(payload,
+                         handler,
+                         scope=None,
+                         context=context,
+                         path='payload',
+                         value_filter=is_function)
+    if not (node_ids or node_instance_ids):
+        return
+    pool = ThreadPool(min(max_concurrent_fetches,
+                          len(node_ids) + len(node_instance_ids)))
+    try:
+        storage.prefetch(node_ids=node_ids,
+                         node_instance_ids=node_instance_ids,
+                         pool=pool)
+    finally:
+        pool.terminate()
 
 
 def _handler(evaluator, **evaluator_kwargs):
@@ -612,7 +749,8 @@ def _handler(evaluator, **evaluator_kwargs):
                                  scope=scope,
                                  context=context,
                                  path=path,
-                                 replace=True)
+                                 replace=True,
+                                 value_filter=is_function)
             scanned = True
         return evaluated_value
     return handler
@@ -645,7 +783,10 @@ def validate_functions(plan):
         return v
 
     # Replace all get_property functions with their instance representation
-    scan.scan_service_template(plan, handler, replace=True)
+    scan.scan_service_template(plan,
+                               handler,
+                               replace=True,
+                               value_filter=is_function)
 
     if not get_property_functions:
         return
@@ -689,4 +830,8 @@ def validate_functions(plan):
         return args[0]
 
     # Change previously replaced get_property instances with raw values
-    scan.scan_service_template(plan, replace_with_raw_function, replace=True)
+    scan.scan_service_template(
+        plan,
+        replace_with_raw_function,
+        replace=True,
+        value_filter=lambda value: isinstance(value, GetProperty))
@@ -43,8 +43,9 @@ def validate_inputs_types(inputs, schema_inputs):
             continue
         input_val = inputs[input_key]
 
-        if functions.parse(input_val) != input_val:
-            # intrinsic function - not validated at the moment
+        if functions.is_function(input_val):
+            # intrinsic function - only its arguments are validated
+            functions.parse(input_val)
             continue
 
         if input_type == 'integer':
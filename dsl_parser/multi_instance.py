@@ -21,29 +21,117 @@ from dsl_parser import (models,
                         constants)
 
 
-def create_deployment_plan(plan):
+def create_deployment_plan(plan,
+                           copy_plan=True,
+                           id_allocator=None,
+                           graph_snapshot=False,
+                           pool=None):
     """
     Expand node instances based on number of instances to deploy and
     defined relationships
+
+    :param plan: The plan to create the deployment plan from.
+    :param copy_plan: Whether to deep copy the plan first. When False,
+                      the plan is consumed: the returned deployment plan
+                      shares its structures with the given plan, which
+                      should no longer be used by the caller.
+    :param id_allocator: The node instance id allocator to use
+                         (see rel_graph.RandomIdAllocator and
+                         rel_graph.CounterIdAllocator). Defaults to random
+                         ids.
+    :param graph_snapshot: Whether to include a snapshot of the deployment
+                           node graph in the deployment plan (under
+                           'deployment_graph_snapshot'), to be passed to
+                           modify_deployment along with the node instances.
+    :param pool: An optional process or thread pool (anything with a
+                 multiprocessing.Pool like map method), used to expand the
+                 independent contained trees of the plan concurrently. The
+                 result is merged in the same order regardless of the pool,
+                 and does not depend on the order in which the trees
+                 complete.
     """
-    deployment_plan = copy.deepcopy(plan)
+    deployment_plan = copy.deepcopy(plan) if copy_plan else dict(plan)
     plan_node_graph = rel_graph.build_node_graph(
         nodes=deployment_plan['nodes'],
         scaling_groups=deployment_plan['scaling_groups'])
     deployment_node_graph, ctx = rel_graph.build_deployment_node_graph(
-        plan_node_graph)
+        plan_node_graph,
+        id_allocator=id_allocator,
+        pool=pool)
     node_instances = rel_graph.extract_node_instances(
         node_instances_graph=deployment_node_graph,
         ctx=ctx)
     deployment_plan[constants.NODE_INSTANCES] = node_instances
+    if graph_snapshot:
+        deployment_plan[constants.DEPLOYMENT_GRAPH_SNAPSHOT] = \
+            rel_graph.deployment_graph_snapshot(
+                plan_node_graph=plan_node_graph,
+                node_instances=node_instances)
     return models.Plan(deployment_plan)
 
 
+def deployment_graph_snapshot(nodes, scaling_groups, node_instances):
+    """
+    Snapshot of the deployment node graph of node_instances, to be passed
+    to modify_deployment along with them (e.g. once the results of a
+    previous modification were applied to the node instances).
+    """
+    plan_node_graph = rel_graph.build_node_graph(
+        nodes=nodes,
+        scaling_groups=scaling_groups)
+    snapshot = rel_graph.deployment_graph_snapshot(
+        plan_node_graph=plan_node_graph,
+        node_instances=node_instances)
+    rel_graph.restore_node_graph(plan_node_graph)
+    return snapshot
+
+
+def iter_deployment_node_instances(plan,
+                                   chunk_size=None,
+                                   id_allocator=None,
+                                   pool=None):
+    """
+    Expand node instances like create_deployment_plan does, but instead of
+    collecting them into a deployment plan, return an iterator yielding
+    them one at a time (or in lists of up to chunk_size node instances), so
+    they can be streamed to their destination.
+
+    The plan is not copied, and is left unchanged.
+    """
+    plan_node_graph = rel_graph.build_node_graph(
+        nodes=plan['nodes'],
+        scaling_groups=plan['scaling_groups'])
+    deployment_node_graph, ctx = rel_graph.build_deployment_node_graph(
+        plan_node_graph,
+        id_allocator=id_allocator,
+        pool=pool)
+    node_instances = rel_graph.iter_node_instances(
+        node_instances_graph=deployment_node_graph,
+        ctx=ctx)
+    if chunk_size:
+        return _chunks(node_instances, chunk_size)
+    return node_instances
+
+
+def _chunks(iterable, chunk_size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
 def modify_deployment(nodes,
                       previous_nodes,
                       previous_node_instances,
                       modified_nodes,
-                      scaling_groups):
+                      scaling_groups,
+                      id_allocator=None,
+                      incremental=False,
+                      previous_graph_snapshot=None):
     """
     modifies deployment according to the expected nodes. based on
     previous_node_instances
@@ -51,25 +139,52 @@ def modify_deployment(nodes,
     :param previous_node_instances:
     :param modified_nodes: existing nodes whose instance number has changed
      Add a line note
+    :param id_allocator: the node instance id allocator to use for added
+     node instances (defaults to random ids)
+    :param incremental: only build the graphs of the nodes the modification
+     may affect (see rel_graph.modification_scope), rather than of the
+     whole deployment (off by default)
+    :param previous_graph_snapshot: a snapshot of the previous deployment
+     node graph (see create_deployment_plan and deployment_graph_snapshot),
+     loaded instead of rebuilding the graph from previous_node_instances
+     (ignored if it doesn't match them)
     :return: a dict of add,extended,reduced and removed instances
      Add a line note
     """
 
+    scope = None
+    reserved_node_instance_ids = None
+    if incremental:
+        scope = rel_graph.modification_scope(
+            nodes=nodes,
+            scaling_groups=scaling_groups,
+            modified_nodes=modified_nodes,
+            previous_nodes=previous_nodes,
+            previous_node_instances=previous_node_instances)
+        reserved_node_instance_ids = _node_instance_and_group_ids(
+            previous_node_instances)
+
     plan_node_graph = rel_graph.build_node_graph(
         nodes=nodes,
-        scaling_groups=scaling_groups)
+        scaling_groups=scaling_groups,
+        scope=scope)
     previous_plan_node_graph = rel_graph.build_node_graph(
         nodes=previous_nodes,
-        scaling_groups=scaling_groups)
+        scaling_groups=scaling_groups,
+        scope=scope)
     previous_deployment_node_graph, previous_deployment_contained_graph = \
         rel_graph.build_previous_deployment_node_graph(
             plan_node_graph=previous_plan_node_graph,
-            previous_node_instances=previous_node_instances)
+            previous_node_instances=previous_node_instances,
+            scope=scope,
+            snapshot=previous_graph_snapshot)
     new_deployment_node_graph, ctx = rel_graph.build_deployment_node_graph(
         plan_node_graph=plan_node_graph,
         previous_deployment_node_graph=previous_deployment_node_graph,
         previous_deployment_contained_graph=previous_deployment_contained_graph,  # noqa
-        modified_nodes=modified_nodes)
+        modified_nodes=modified_nodes,
+        id_allocator=id_allocator,
+        reserved_node_instance_ids=reserved_node_instance_ids)
 
     # Any node instances which were added or removed
     added_and_related = rel_graph.extract_added_node_instances(
@@ -104,6 +219,15 @@ def modify_deployment(nodes,
     }
 
 
+def _node_instance_and_group_ids(node_instances):
+    ids = set()
+    for node_instance in node_instances:
+        ids.add(node_instance['id'])
+        for scaling_group in node_instance.get('scaling_groups') or ():
+            ids.add(scaling_group['id'])
+    return ids
+
+
 def filter_out_node_instances(node_instances_to_filter_out,
                               base_node_instances):
     instance_ids_to_remove = [n['id'] for n in node_instances_to_filter_out
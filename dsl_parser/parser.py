@@ -28,7 +28,8 @@ def parse_from_path(dsl_file_path,
                     resources_base_url=None,
                     resolver=None,
                     validate_version=True,
-                    additional_resource_sources=()):
+                    additional_resource_sources=(),
+                    compact_plan=False):
     with open(dsl_file_path, 'r') as f:
         dsl_string = f.read()
     return _parse(dsl_string,
@@ -36,14 +37,16 @@ def parse_from_path(dsl_file_path,
                   dsl_location=dsl_file_path,
                   resolver=resolver,
                   validate_version=validate_version,
-                  additional_resource_sources=additional_resource_sources)
+                  additional_resource_sources=additional_resource_sources,
+                  compact_plan=compact_plan)
 
 
 def parse_from_url(dsl_url,
                    resources_base_url=None,
                    resolver=None,
                    validate_version=True,
-                   additional_resource_sources=()):
+                   additional_resource_sources=(),
+                   compact_plan=False):
     try:
         with contextlib.closing(urllib2.urlopen(dsl_url)) as f:
             dsl_string = f.read()
@@ -60,17 +63,20 @@ def parse_from_url(dsl_url,
                   dsl_location=dsl_url,
                   resolver=resolver,
                   validate_version=validate_version,
-                  additional_resource_sources=additional_resource_sources)
+                  additional_resource_sources=additional_resource_sources,
+                  compact_plan=compact_plan)
 
 
 def parse(dsl_string,
           resources_base_url=None,
           resolver=None,
-          validate_version=True):
+          validate_version=True,
+          compact_plan=False):
     return _parse(dsl_string,
                   resources_base_url=resources_base_url,
                   resolver=resolver,
-                  validate_version=validate_version)
+                  validate_version=validate_version,
+                  compact_plan=compact_plan)
 
 
 def _parse(dsl_string,
@@ -78,7 +84,8 @@ def _parse(dsl_string,
            dsl_location=None,
            resolver=None,
            validate_version=True,
-           additional_resource_sources=()):
+           additional_resource_sources=(),
+           compact_plan=False):
     parsed_dsl_holder = utils.load_yaml(raw_yaml=dsl_string,
                                         error_message='Failed to parse DSL',
                                         filename=dsl_location)
@@ -120,7 +127,8 @@ def _parse(dsl_string,
         value=merged_blueprint_holder,
         inputs={
             'resource_base': resource_base,
-            'validate_version': validate_version
+            'validate_version': validate_version,
+            'compact_plan': compact_plan
         },
         element_cls=blueprint.Blueprint)
 
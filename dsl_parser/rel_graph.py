@@ -15,11 +15,10 @@
 
 import copy
 import collections
+import random
 from random import choice
 from string import ascii_lowercase, digits
 
-import networkx as nx
-
 from dsl_parser import constants
 from dsl_parser import exceptions
 
@@ -33,36 +32,167 @@ CONNECTION_TYPE = 'connection_type'
 ALL_TO_ALL = 'all_to_all'
 ALL_TO_ONE = 'all_to_one'
 
+# edge data. relationship_template means relationship is the plan
+# relationship, shared by all the edges created for it, rather than the
+# relationship instance of the edge (see _edge_relationship_instance)
+Edge = collections.namedtuple('Edge', ['relationship',
+                                       'index',
+                                       'relationship_template'])
+
+_NO_TARGETS = {}
+
+
+class DiGraph(object):
+    """
+    The directed graph the plan and deployment graphs are built with,
+    providing just the operations this module needs.
+
+    node maps each node to its attributes dict, and only nodes with
+    outgoing edges have a targets dict, mapping each target to the edge
+    data (an Edge, or None). Likewise, only nodes with incoming edges have
+    a sources set, so that the edges into a few nodes can be found
+    without scanning all edges (see in_edges).
+    """
+
+    def __init__(self):
+        self.node = {}
+        self._targets = {}
+        self._sources = {}
+
+    def __contains__(self, n):
+        return n in self.node
+
+    def __iter__(self):
+        return iter(self.node)
+
+    def __len__(self):
+        return len(self.node)
+
+    def number_of_nodes(self):
+        return len(self.node)
+
+    def number_of_edges(self):
+        return sum(len(targets) for targets in self._targets.itervalues())
+
+    def add_node(self, n, attr_dict=None, **attr):
+        # like networkx, a new node takes ownership of attr_dict, and the
+        # attributes of an existing node are updated
+        if attr_dict is None:
+            attr_dict = attr
+        else:
+            attr_dict.update(attr)
+        if n in self.node:
+            self.node[n].update(attr_dict)
+        else:
+            self.node[n] = attr_dict
+
+    def add_edge(self, source, target, edge=None):
+        if source not in self.node:
+            self.node[source] = {}
+        if target not in self.node:
+            self.node[target] = {}
+        targets = self._targets.get(source)
+        if targets is None:
+            targets = self._targets[source] = {}
+        targets[target] = edge
+        sources = self._sources.get(target)
+        if sources is None:
+            sources = self._sources[target] = set()
+        sources.add(source)
+
+    def add_edges_from(self, edges, edge=None):
+        for source, target in edges:
+            self.add_edge(source, target, edge)
+
+    def has_edge(self, source, target):
+        return target in self._targets.get(source, _NO_TARGETS)
+
+    def targets(self, n):
+        """The targets of n mapped to the edge data, not to be modified."""
+        return self._targets.get(n, _NO_TARGETS)
+
+    def adjacency_iter(self):
+        """(node, targets) of the nodes with outgoing edges."""
+        return self._targets.iteritems()
+
+    def nodes_iter(self, data=False):
+        if data:
+            return self.node.iteritems()
+        return iter(self.node)
+
+    def nodes(self, data=False):
+        return list(self.nodes_iter(data=data))
+
+    def edges_iter(self, data=False):
+        for source, targets in self._targets.iteritems():
+            for target, edge in targets.iteritems():
+                if data:
+                    yield source, target, edge
+                else:
+                    yield source, target
+
+    def edges(self, data=False):
+        return list(self.edges_iter(data=data))
+
+    def in_edges(self, nodes):
+        """(source, target, edge) of the edges into nodes."""
+        for target in nodes:
+            for source in self._sources.get(target, ()):
+                yield source, target, self._targets[source][target]
+
+    def copy(self):
+        """A copy of the structure, sharing node attributes and edges."""
+        result = DiGraph()
+        result.node = dict(self.node)
+        result._targets = dict((source, dict(targets))
+                               for source, targets
+                               in self._targets.iteritems())
+        result._sources = dict((target, set(sources))
+                               for target, sources
+                               in self._sources.iteritems())
+        return result
+
+    def subgraph(self, nodes):
+        """The subgraph induced by nodes, sharing node attributes and
+        edges."""
+        result = DiGraph()
+        for n in nodes:
+            if n in self.node:
+                result.node[n] = self.node[n]
+        for source in result.node:
+            for target, edge in self.targets(source).iteritems():
+                if target in result.node:
+                    result.add_edge(source, target, edge)
+        return result
 
-def build_node_graph(nodes, scaling_groups):
 
-    graph = nx.DiGraph()
-    groups_graph = nx.DiGraph()
+def build_node_graph(nodes, scaling_groups, scope=None):
+    """
+    :param scope: When given, only the nodes and scaling groups whose ids
+                  are in it (see modification_scope) are included in the
+                  graph, along with the relationships between them.
+    """
+
+    graph = DiGraph()
+    member_of = {}
     node_ids = set()
     contained_in_group = {}
 
+    if scope is not None:
+        nodes = [node for node in nodes if node['id'] in scope]
+        scaling_groups = dict((group_name, group) for group_name, group
+                              in scaling_groups.items()
+                              if group_name in scope)
+
     for node in nodes:
         node_id = node['id']
         node_ids.add(node_id)
-        if 'capabilities' in node:
-            # This code path is used by unit tests
-            scale_properties = node['capabilities']['scalable']['properties']
-        else:
-            # This code path is used by actual code
-            scale_properties = {
-                'current_instances': node['number_of_instances'],
-                'default_instances':
-                    node['deploy_number_of_instances'],
-                'min_instances': node['min_number_of_instances'],
-                'max_instances': node['max_number_of_instances']
-            }
         graph.add_node(node_id,
                        node=node,
-                       scale_properties=scale_properties)
+                       scale_properties=_scale_properties(node))
 
     for group_name, group in scaling_groups.items():
         scale_properties = group['properties']
-        groups_graph.add_node(group_name)
         graph.add_node(group_name,
                        node={'id': group_name, 'group': True},
                        scale_properties=scale_properties)
@@ -70,101 +200,318 @@ def build_node_graph(nodes, scaling_groups):
     for group_name, group in scaling_groups.items():
         for member in group['members']:
             graph.add_edge(member, group_name,
-                           relationship={
-                               'type': GROUP_CONTAINED_IN_REL_TYPE,
-                               'type_hierarchy': [GROUP_CONTAINED_IN_REL_TYPE],
-                               'target_id': group_name
-                           },
-                           index=-1)
-            groups_graph.add_edge(member, group_name)
+                           _group_contained_in_edge(group_name))
+            member_of[member] = group_name
             if member in node_ids:
                 contained_in_group[member] = group_name
+    top_level_groups = _top_level_groups(member_of)
 
     for node in nodes:
         node_id = node['id']
         for index, relationship in enumerate(node.get(RELATIONSHIPS, [])):
             target_id = relationship['target_id']
+            if scope is not None and target_id not in scope:
+                continue
             if (CONTAINED_IN_REL_TYPE in relationship['type_hierarchy'] and
                     node_id in contained_in_group):
                 group_name = contained_in_group[node_id]
                 relationship['target_id'] = group_name
                 relationship['replaced'] = target_id
                 graph.add_edge(node_id, group_name,
-                               relationship=relationship,
-                               index=index)
-                top_level_group_name = nx.topological_sort(
-                    groups_graph, nbunch=[group_name])[-1]
-                graph.add_edge(
-                    top_level_group_name, target_id,
-                    relationship={
-                        'type': GROUP_CONTAINED_IN_REL_TYPE,
-                        'type_hierarchy': [GROUP_CONTAINED_IN_REL_TYPE],
-                        'target_id': target_id
-                    },
-                    index=-1)
+                               Edge(relationship, index, False))
+                graph.add_edge(top_level_groups[node_id], target_id,
+                               _group_contained_in_edge(target_id))
             else:
                 graph.add_edge(node_id, target_id,
-                               relationship=relationship,
-                               index=index)
+                               Edge(relationship, index, False))
 
     return graph
 
 
-def build_previous_deployment_node_graph(plan_node_graph,
-                                         previous_node_instances):
-    graph = nx.DiGraph()
-    contained_graph = nx.DiGraph()
-    for node_instance in previous_node_instances:
-        node_instance_id = node_instance['id']
-        node_instance_host_id = node_instance.get('host_id')
-        graph.add_node(node_instance_id,
-                       node=node_instance)
-        contained_graph.add_node(node_instance_id,
-                                 node=node_instance)
-        scaling_groups = node_instance.get('scaling_groups') or ()
-        for scaling_group in scaling_groups:
-            group_id = scaling_group['id']
-            group_name = scaling_group['name']
-            node = {'id': group_id, 'name': group_name, 'group': True}
-            if node_instance_host_id:
-                node['host_id'] = node_instance_host_id
-            graph.add_node(group_id, node=node)
-            contained_graph.add_node(group_id, node=node)
+def _top_level_groups(member_of):
+    # members are in one group only, so the groups containing a member form
+    # a chain, ending with its top level group. Each chain is walked once.
+    result = {}
+    for member in member_of:
+        chain = []
+        while member in member_of and member not in result:
+            chain.append(member)
+            member = member_of[member]
+        top_level_group_name = result.get(member, member)
+        for member in chain:
+            result[member] = top_level_group_name
+    return result
 
+
+def _group_contained_in_edge(target_id):
+    return Edge(relationship={
+                    'type': GROUP_CONTAINED_IN_REL_TYPE,
+                    'type_hierarchy': [GROUP_CONTAINED_IN_REL_TYPE],
+                    'target_id': target_id
+                },
+                index=-1,
+                relationship_template=False)
+
+
+def restore_node_graph(plan_node_graph):
+    """
+    Undo the changes build_node_graph makes to the relationships of nodes
+    contained in scaling groups.
+    """
+    for _, data in plan_node_graph.nodes_iter(data=True):
+        node = data['node']
+        for relationship in node.get('relationships', []):
+            replaced = relationship.pop('replaced', None)
+            if replaced:
+                relationship['target_id'] = replaced
+
+
+def _scale_properties(node):
+    if 'capabilities' in node:
+        # This code path is used by unit tests
+        return node['capabilities']['scalable']['properties']
+    # This code path is used by actual code
+    return {
+        'current_instances': node['number_of_instances'],
+        'default_instances':
+            node['deploy_number_of_instances'],
+        'min_instances': node['min_number_of_instances'],
+        'max_instances': node['max_number_of_instances']
+    }
+
+
+def modification_scope(nodes,
+                       scaling_groups,
+                       modified_nodes,
+                       previous_nodes,
+                       previous_node_instances):
+    """
+    Ids of the nodes and scaling groups a deployment modification may
+    affect, so that the modification graphs can be built for these only.
+
+    These are the contained trees (connected by contained_in relationships
+    and group membership) of the modified nodes, and the contained trees of
+    nodes related to them by any other relationship, in either direction.
+
+    Besides the nodes in modified_nodes, nodes that were added, removed or
+    changed between previous_nodes and nodes (as done by deployment
+    updates), and nodes and groups whose previous node instances don't
+    match the plan (in total number of instances or in relationships) are
+    considered modified.
+    """
+    all_nodes = list(nodes)
+    if previous_nodes is not nodes:
+        all_nodes += previous_nodes
+    # undirected adjacency sets
+    contained_graph = {}
+    connected_graph = {}
+    for node in all_nodes:
+        node_id = node['id']
+        contained_graph.setdefault(node_id, set())
+        for relationship in node.get(RELATIONSHIPS, []):
+            target_id = relationship['target_id']
+            if CONTAINED_IN_REL_TYPE in relationship['type_hierarchy']:
+                adjacency = contained_graph
+            else:
+                adjacency = connected_graph
+            adjacency.setdefault(node_id, set()).add(target_id)
+            adjacency.setdefault(target_id, set()).add(node_id)
+    for group_name, group in scaling_groups.items():
+        contained_graph.setdefault(group_name, set())
+        for member in group['members']:
+            contained_graph.setdefault(member, set()).add(group_name)
+            contained_graph[group_name].add(member)
+
+    modified_ids = set(modified_nodes) if isinstance(modified_nodes, dict) \
+        else set()
+    if previous_nodes is not nodes:
+        previous = dict((node['id'], _node_signature(node))
+                        for node in previous_nodes)
+        current = dict((node['id'], _node_signature(node))
+                       for node in nodes)
+        modified_ids.update(
+            node_id for node_id in set(previous) | set(current)
+            if previous.get(node_id) != current.get(node_id))
+    modified_ids.update(_inconsistent_node_ids(
+        nodes=nodes,
+        scaling_groups=scaling_groups,
+        previous_node_instances=previous_node_instances))
+
+    components = {}
+    for node_id in contained_graph:
+        if node_id in components:
+            continue
+        component = set([node_id])
+        stack = [node_id]
+        while stack:
+            for neighbor_id in contained_graph[stack.pop()]:
+                if neighbor_id not in component:
+                    component.add(neighbor_id)
+                    stack.append(neighbor_id)
+        for component_node_id in component:
+            components[component_node_id] = component
+    scope = set()
+    for node_id in modified_ids:
+        scope.update(components.get(node_id, [node_id]))
+    for node_id in list(scope):
+        for related_node_id in connected_graph.get(node_id, ()):
+            scope.update(components[related_node_id])
+    return scope
+
+
+def _node_signature(node):
+    return (_scale_properties(node),
+            [(relationship['type'], relationship['target_id'])
+             for relationship in node.get(RELATIONSHIPS, [])])
+
+
+def _inconsistent_node_ids(nodes, scaling_groups, previous_node_instances):
+    # nodes and groups whose previous node instances don't add up to their
+    # number of instances (times the number of instances of their
+    # container), or whose relationships don't match the node relationships
+    current_instances = {}
+    containers = {}
+    relationships = {}
+    for node in nodes:
+        node_id = node['id']
+        current_instances[node_id] = _scale_properties(node)[
+            'current_instances']
+        relationships[node_id] = frozenset(
+            (relationship['type'], relationship['target_id'])
+            for relationship in node.get(RELATIONSHIPS, []))
+        for relationship in node.get(RELATIONSHIPS, []):
+            if CONTAINED_IN_REL_TYPE in relationship['type_hierarchy']:
+                containers[node_id] = relationship['target_id']
+    member_of = {}
+    for group_name, group in scaling_groups.items():
+        current_instances[group_name] = group['properties'][
+            'current_instances']
+        for member in group['members']:
+            member_of[member] = group_name
+    # top level groups are contained in the container of their members
+    for member, top_level_group_name in _top_level_groups(member_of).items():
+        if member in containers:
+            containers[top_level_group_name] = containers[member]
+    containers.update(member_of)
+
+    expected_counts = {}
+    for node_id in current_instances:
+        chain = []
+        while node_id is not None and node_id not in expected_counts:
+            chain.append(node_id)
+            node_id = containers.get(node_id)
+        count = expected_counts[node_id] if node_id is not None else 1
+        for node_id in reversed(chain):
+            count *= current_instances.get(node_id, 0)
+            expected_counts[node_id] = count
+
+    counts = collections.defaultdict(int)
+    group_instance_ids = collections.defaultdict(set)
+    instance_relationships = collections.defaultdict(set)
     for node_instance in previous_node_instances:
+        node_id = _node_id_from_node_instance(node_instance)
+        counts[node_id] += 1
+        for scaling_group in node_instance.get('scaling_groups') or ():
+            group_instance_ids[scaling_group['name']].add(scaling_group['id'])
+        instance_relationships[node_id].add(frozenset(
+            (relationship['type'], relationship['target_name'])
+            for relationship in node_instance.get(RELATIONSHIPS, [])))
+    for group_name, ids in group_instance_ids.items():
+        counts[group_name] = len(ids)
+
+    result = set()
+    for node_id in set(expected_counts) | set(counts):
+        if expected_counts.get(node_id, 0) != counts.get(node_id, 0):
+            result.add(node_id)
+    for node_id, node_relationships in instance_relationships.items():
+        if node_relationships != set([relationships.get(node_id)]):
+            result.add(node_id)
+    return result
+
+
+GRAPH_SNAPSHOT_VERSION = 2
+PLAIN_RELATIONSHIP = 0
+CONTAINED_IN_RELATIONSHIP = 1
+REPLACED_CONTAINED_IN_RELATIONSHIP = 2
+
+
+def build_previous_deployment_node_graph(plan_node_graph,
+                                         previous_node_instances,
+                                         scope=None,
+                                         snapshot=None):
+    """
+    :param scope: When given, only node instances of the nodes whose ids
+                  are in it (see modification_scope) are included in the
+                  graph, along with the relationships between them.
+    :param snapshot: A snapshot of the previous node instances graph (see
+                     deployment_graph_snapshot). When given and it matches
+                     previous_node_instances, the graph is loaded from it
+                     instead of deriving containment and scaling groups
+                     from the node instances again.
+    """
+    node_instances = dict((node_instance['id'], node_instance)
+                          for node_instance in previous_node_instances)
+    valid_snapshot = _valid_graph_snapshot(snapshot, node_instances)
+    if scope is not None:
+        previous_node_instances = [
+            node_instance for node_instance in previous_node_instances
+            if _node_id_from_node_instance(node_instance) in scope]
+        node_instances = dict((node_instance['id'], node_instance)
+                              for node_instance in previous_node_instances)
+    if not valid_snapshot:
+        snapshot = deployment_graph_snapshot(plan_node_graph,
+                                             previous_node_instances,
+                                             scope=scope)
+    return _load_graph_snapshot(snapshot, node_instances, scope)
+
+
+def deployment_graph_snapshot(plan_node_graph, node_instances, scope=None):
+    """
+    A compact, JSON serializable snapshot of the containment and scaling
+    groups structure of the node instances graph, that
+    build_previous_deployment_node_graph can load along with the node
+    instances on the next deployment modification.
+
+    Relationships are referred to by their index in the node instance
+    relationships, so the snapshot is only valid for the given node
+    instances. The (type, target_name) of each node instance relationship
+    is recorded, so that a snapshot of node instances whose relationships
+    changed since is recognized as such.
+
+    :param scope: When given, relationships to nodes not in it are left out
+                  (see build_previous_deployment_node_graph).
+    """
+    groups = {}
+    relationships = []
+    group_relationships = {}
+    for node_instance in node_instances:
         node_instance_id = node_instance['id']
+        node_instance_host_id = node_instance.get('host_id')
         node_id = _node_id_from_node_instance(node_instance)
         scaling_groups = node_instance.get('scaling_groups')
+        for scaling_group in scaling_groups or ():
+            groups[scaling_group['id']] = [scaling_group['name'],
+                                           node_instance_host_id]
         contained_in_target_id = None
         contained_in_target_name = None
         for index, rel in enumerate(node_instance.get('relationships', [])):
-            target_id = rel['target_id']
             target_name = rel['target_name']
+            if scope is not None and target_name not in scope:
+                continue
             # if the original relationship does not exist in the plan node
             # graph, it means it was a contained_in relationship that was
             # replaced by a scaling group
-            replaced_contained_in = target_name not in plan_node_graph[node_id]
-            if replaced_contained_in:
-                contained_in_target_id = target_id
+            plan_edge = plan_node_graph.targets(node_id).get(target_name)
+            if plan_edge is None:
+                contained_in_target_id = rel['target_id']
                 contained_in_target_name = target_name
-                # for the purpose of containment, only the first group
-                # is relevant
-                scaling_group = scaling_groups[0]
-                rel['target_id'] = scaling_group['id']
-                rel['target_name'] = scaling_group['name']
-                rel['replaced'] = True
-                graph.add_edge(node_instance_id, scaling_group['id'],
-                               relationship=rel,
-                               index=index)
-                contained_graph.add_edge(node_instance_id, scaling_group['id'])
+                kind = REPLACED_CONTAINED_IN_RELATIONSHIP
+            elif _relationship_type_hierarchy_includes_one_of(
+                    plan_edge.relationship, [CONTAINED_IN_REL_TYPE]):
+                kind = CONTAINED_IN_RELATIONSHIP
             else:
-                graph.add_edge(node_instance_id, target_id,
-                               relationship=rel,
-                               index=index)
-                if _relationship_type_hierarchy_includes_one_of(
-                    plan_node_graph[node_id][target_name]['relationship'],
-                        [CONTAINED_IN_REL_TYPE]):
-                    contained_graph.add_edge(node_instance_id, target_id)
+                kind = PLAIN_RELATIONSHIP
+            relationships.append([node_instance_id, index, kind])
 
         if scaling_groups:
             scaling_groups = scaling_groups[:]
@@ -179,36 +526,118 @@ def build_previous_deployment_node_graph(plan_node_graph,
                     'name': node_id
                 })
             for i in range(len(scaling_groups) - 1):
-                graph.add_edge(
-                    scaling_groups[i]['id'],
-                    scaling_groups[i+1]['id'],
-                    relationship={
+                group_relationships[(scaling_groups[i]['id'],
+                                     scaling_groups[i+1]['id'])] = \
+                    scaling_groups[i+1]['name']
+    return {
+        'version': GRAPH_SNAPSHOT_VERSION,
+        'node_instances': [[node_instance['id'],
+                            _relationship_signatures(node_instance)]
+                           for node_instance in node_instances],
+        'groups': [[group_id, name, host_id]
+                   for group_id, (name, host_id) in groups.iteritems()],
+        'relationships': relationships,
+        'group_relationships': [
+            [source_id, target_id, group_name]
+            for (source_id, target_id), group_name
+            in group_relationships.iteritems()]
+    }
+
+
+def _relationship_signatures(node_instance):
+    return [[rel['type'], rel['target_name']]
+            for rel in node_instance.get('relationships') or ()]
+
+
+def _valid_graph_snapshot(snapshot, node_instances):
+    if not snapshot or snapshot.get('version') != GRAPH_SNAPSHOT_VERSION:
+        return False
+    if len(node_instances) != len(snapshot['node_instances']):
+        return False
+    for node_instance_id, signatures in snapshot['node_instances']:
+        node_instance = node_instances.get(node_instance_id)
+        if node_instance is None or \
+                _relationship_signatures(node_instance) != signatures:
+            return False
+    # relationship indexes are in range, as the relationships of each node
+    # instance match the snapshot
+    for node_instance_id, index, kind in snapshot['relationships']:
+        if (kind == REPLACED_CONTAINED_IN_RELATIONSHIP and
+                not node_instances[node_instance_id].get('scaling_groups')):
+            return False
+    return True
+
+
+def _load_graph_snapshot(snapshot, node_instances, scope=None):
+    # both graphs share the node attributes and edges
+    graph = DiGraph()
+    contained_graph = DiGraph()
+    for node_instance_id, node_instance in node_instances.iteritems():
+        graph.add_node(node_instance_id, node=node_instance)
+    for group_id, group_name, host_id in snapshot['groups']:
+        if scope is not None and group_name not in scope:
+            continue
+        node = {'id': group_id, 'name': group_name, 'group': True}
+        if host_id:
+            node['host_id'] = host_id
+        graph.add_node(group_id, node=node)
+    for node_id, data in graph.nodes_iter(data=True):
+        contained_graph.add_node(node_id, data)
+
+    for node_instance_id, index, kind in snapshot['relationships']:
+        node_instance = node_instances.get(node_instance_id)
+        if node_instance is None:
+            continue
+        rel = node_instance['relationships'][index]
+        if scope is not None and rel['target_name'] not in scope:
+            continue
+        if kind == REPLACED_CONTAINED_IN_RELATIONSHIP:
+            # for the purpose of containment, only the first group
+            # is relevant
+            scaling_group = node_instance['scaling_groups'][0]
+            rel['target_id'] = scaling_group['id']
+            rel['target_name'] = scaling_group['name']
+            rel['replaced'] = True
+        edge = Edge(rel, index, False)
+        graph.add_edge(node_instance_id, rel['target_id'], edge)
+        if kind != PLAIN_RELATIONSHIP:
+            contained_graph.add_edge(node_instance_id, rel['target_id'], edge)
+    for source_id, target_id, target_name in snapshot['group_relationships']:
+        if scope is not None and target_name not in scope:
+            continue
+        edge = Edge(relationship={
                         'type': GROUP_CONTAINED_IN_REL_TYPE,
-                        'target_id': scaling_groups[i+1]['id'],
-                        'target_name': scaling_groups[i+1]['name']
+                        'target_id': target_id,
+                        'target_name': target_name
                     },
-                    index=-1)
-                contained_graph.add_edge(scaling_groups[i]['id'],
-                                         scaling_groups[i+1]['id'])
+                    index=-1,
+                    relationship_template=False)
+        graph.add_edge(source_id, target_id, edge)
+        contained_graph.add_edge(source_id, target_id, edge)
     return graph, contained_graph
 
 
 def build_deployment_node_graph(plan_node_graph,
                                 previous_deployment_node_graph=None,
                                 previous_deployment_contained_graph=None,
-                                modified_nodes=None):
+                                modified_nodes=None,
+                                id_allocator=None,
+                                reserved_node_instance_ids=None,
+                                pool=None):
 
     _verify_no_unsupported_relationships(plan_node_graph)
 
-    deployment_node_graph = nx.DiGraph()
+    deployment_node_graph = DiGraph()
     ctx = Context(
         plan_node_graph=plan_node_graph,
         deployment_node_graph=deployment_node_graph,
         previous_deployment_node_graph=previous_deployment_node_graph,
         previous_deployment_contained_graph=previous_deployment_contained_graph,  # noqa
-        modified_nodes=modified_nodes)
+        modified_nodes=modified_nodes,
+        id_allocator=id_allocator,
+        reserved_node_instance_ids=reserved_node_instance_ids)
 
-    _handle_contained_in(ctx)
+    _handle_contained_in(ctx, pool=pool)
 
     ctx.node_instance_ids.clear()
     ctx.node_ids_to_node_instance_ids.clear()
@@ -229,26 +658,36 @@ def extract_node_instances(node_instances_graph,
                            ctx,
                            copy_instances=False,
                            contained_graph=None):
+    return list(iter_node_instances(node_instances_graph,
+                                    ctx=ctx,
+                                    copy_instances=copy_instances,
+                                    contained_graph=contained_graph))
+
+
+def iter_node_instances(node_instances_graph,
+                        ctx,
+                        copy_instances=False,
+                        contained_graph=None):
+    """Generator version of extract_node_instances, yielding the node
+    instances (with their relationship instances) one at a time."""
     contained_graph = contained_graph or ctx.deployment_contained_graph
     added_missing_node_instance_ids = set()
-    node_instances = []
     for node_instance_id, data in node_instances_graph.nodes_iter(data=True):
         node_instance = data['node']
         if node_instance.get('group'):
             continue
         node_instance_attributes = data.get('node_instance_attributes')
         if copy_instances:
-            node_instance = copy.deepcopy(node_instance)
+            node_instance = _node_instance_deepcopy(node_instance)
         if node_instance_attributes:
             node_instance.update(node_instance_attributes)
         indexed_relationship_instances = []
-        for target_node_instance_id in node_instances_graph.neighbors_iter(
-                node_instance_id):
-            edge_data = node_instances_graph[node_instance_id][
-                target_node_instance_id]
-            relationship_instance = edge_data['relationship']
-            relationship_index = edge_data['index']
-            if copy_instances:
+        for target_node_instance_id, edge in node_instances_graph.targets(
+                node_instance_id).iteritems():
+            relationship_instance = _edge_relationship_instance(
+                edge, target_node_instance_id)
+            relationship_index = edge.index
+            if copy_instances and not edge.relationship_template:
                 relationship_instance = copy.deepcopy(relationship_instance)
             group_rel = (relationship_instance['type'] ==
                          GROUP_CONTAINED_IN_REL_TYPE)
@@ -282,19 +721,25 @@ def extract_node_instances(node_instances_graph,
                         target_node_instance = contained_graph.node[target_id][
                             'node']
                         if copy_instances:
-                            target_node_instance = copy.deepcopy(
+                            target_node_instance = _node_instance_deepcopy(
                                 target_node_instance)
                         target_node_instance[RELATIONSHIPS] = []
-                        node_instances.append(target_node_instance)
                         added_missing_node_instance_ids.add(target_id)
+                        yield target_node_instance
             if not group_rel:
                 indexed_relationship_instances.append(
                     (relationship_index, relationship_instance))
         indexed_relationship_instances.sort(key=lambda (index, _): index)
         relationship_instances = [r for _, r in indexed_relationship_instances]
         node_instance[RELATIONSHIPS] = relationship_instances
-        node_instances.append(node_instance)
-    return node_instances
+        yield node_instance
+
+
+def _node_instance_deepcopy(node_instance):
+    # relationships are replaced on extraction, no need to copy them
+    return dict((key, copy.deepcopy(value))
+                for key, value in node_instance.iteritems()
+                if key != RELATIONSHIPS)
 
 
 def extract_added_node_instances(previous_deployment_node_graph,
@@ -355,18 +800,25 @@ def extract_removed_relationships(previous_deployment_node_graph,
 
 
 def _graph_diff(G, H, node_instance_attributes):
-    result = nx.DiGraph()
-    for n1, data in G.nodes_iter(data=True):
-        if n1 in H:
-            continue
-        result.add_node(n1, data,
+    """
+    The node instances of G which are not in H (with
+    node_instance_attributes), along with the node instances related to
+    them and the relationships between them.
+    """
+    result = DiGraph()
+    diff = G.node.viewkeys() - H.node.viewkeys()
+    for n1 in diff:
+        result.add_node(n1, dict(G.node[n1]),
                         node_instance_attributes=node_instance_attributes)
-        for n2 in G.neighbors_iter(n1):
-            result.add_node(n2, G.node[n2])
-            result.add_edge(n1, n2, G[n1][n2])
-        for n2 in G.predecessors_iter(n1):
-            result.add_node(n2, G.node[n2])
-            result.add_edge(n2, n1, G[n2][n1])
+    for n1 in diff:
+        for n2, edge in G.targets(n1).iteritems():
+            if n2 not in result:
+                result.add_node(n2, dict(G.node[n2]))
+            result.add_edge(n1, n2, edge)
+    for n2, n1, edge in G.in_edges(diff):
+        if n2 not in result:
+            result.add_node(n2, dict(G.node[n2]))
+        result.add_edge(n2, n1, edge)
     return result
 
 
@@ -376,73 +828,138 @@ def _graph_diff_relationships(G, H, node_instance_attributes):
     :param G:
     :param H:
     :param node_instance_attributes:
-    :return:
+    :return: a graph of the node instances that are in both G and H and
+     have relationships in G which are not in H (with
+     node_instance_attributes), along with the targets of these
+     relationships.
     """
-    result = nx.DiGraph()
-    for source, dest, data in G.edges_iter(data=True):
-        if source in H and dest not in H[source]:
-            new_node = copy.deepcopy(G.node[source])
-            result.add_node(source, new_node,
+    result = DiGraph()
+    for source, G_targets in G.adjacency_iter():
+        if source not in H:
+            continue
+        dests = G_targets.viewkeys() - H.targets(source).viewkeys()
+        if not dests:
+            continue
+        if source in result:
+            result.node[source]['node_instance_attributes'] = \
+                node_instance_attributes
+        else:
+            result.add_node(source, dict(G.node[source]),
                             node_instance_attributes=node_instance_attributes)
-            result.add_node(dest, G.node[dest])
-            result.add_edge(source, dest, G[source][dest])
+        for dest in dests:
+            if dest not in result:
+                result.add_node(dest, dict(G.node[dest]))
+            result.add_edge(source, dest, G_targets[dest])
     return result
 
 
-def _handle_contained_in(ctx):
-    # for each 'contained' tree, recursively build new trees based on
-    # scaling groups with generated ids
-    for contained_tree in nx.weakly_connected_component_subgraphs(
-            ctx.plan_contained_graph.reverse(copy=True)):
-        # extract tree root node id
-        node_id = nx.topological_sort(contained_tree)[0]
-        _build_multi_instance_node_tree_rec(
-            node_id=node_id,
-            contained_tree=contained_tree,
-            ctx=ctx)
+def _handle_contained_in(ctx, pool=None):
+    # for each 'contained' tree, build new trees based on scaling groups
+    # with generated ids. Every node is contained in at most one node, so
+    # the roots are the nodes not contained in any node, and the children of
+    # a node are its predecessors in the plan contained graph.
+    graph = ctx.plan_contained_graph
+    children = dict((node_id, []) for node_id in graph.nodes_iter())
+    roots = []
+    for node_id in graph.nodes_iter():
+        targets = graph.targets(node_id)
+        if not targets:
+            roots.append(node_id)
+        for target_id in targets:
+            children[target_id].append(node_id)
+    if pool is None or ctx.is_modification:
+        for node_id in roots:
+            _build_multi_instance_node_tree(
+                node_id=node_id,
+                children=children,
+                ctx=ctx)
+    else:
+        # the trees are independent until connected relationships are
+        # handled, so they are expanded by the pool, and merged back in
+        # roots order regardless of the order in which they complete
+        tasks = [_contained_tree_task(node_id, children, ctx)
+                 for node_id in roots]
+        for nodes, edges in pool.map(_expand_contained_tree, tasks):
+            for node_instance_id, data in nodes:
+                ctx.deployment_node_graph.add_node(node_instance_id, data)
+            for source, target, data in edges:
+                ctx.deployment_node_graph.add_edge(source, target, data)
     ctx.deployment_contained_graph = ctx.deployment_node_graph.copy()
 
 
-def _build_multi_instance_node_tree_rec(node_id,
-                                        contained_tree,
-                                        ctx,
-                                        parent_relationship=None,
-                                        parent_relationship_index=None,
-                                        parent_node_instance_id=None,
-                                        current_host_instance_id=None):
-    node = contained_tree.node[node_id]['node']
-    containers = _build_and_update_node_instances(
-        ctx=ctx,
-        node=node,
-        parent_node_instance_id=parent_node_instance_id,
-        parent_relationship=parent_relationship,
-        current_host_instance_id=current_host_instance_id)
-    for container in containers:
-        node_instance = container.node_instance
-        node_instance_id = node_instance['id']
-        relationship_instance = container.relationship_instance
-        new_current_host_instance_id = container.current_host_instance_id
-        ctx.deployment_node_graph.add_node(node_instance_id,
-                                           node=node_instance)
-        if parent_node_instance_id is not None:
-            ctx.deployment_node_graph.add_edge(
-                node_instance_id, parent_node_instance_id,
-                relationship=relationship_instance,
-                index=parent_relationship_index)
-        for child_node_id in contained_tree.neighbors_iter(node_id):
-            descendants = nx.descendants(contained_tree, child_node_id)
-            descendants.add(child_node_id)
-            child_contained_tree = contained_tree.subgraph(descendants)
-            _build_multi_instance_node_tree_rec(
-                node_id=child_node_id,
-                contained_tree=child_contained_tree,
-                ctx=ctx,
-                parent_relationship=ctx.plan_node_graph[
-                    child_node_id][node_id]['relationship'],
-                parent_relationship_index=ctx.plan_node_graph[
-                    child_node_id][node_id]['index'],
-                parent_node_instance_id=node_instance_id,
-                current_host_instance_id=new_current_host_instance_id)
+def _contained_tree_task(root_node_id, children, ctx):
+    tree_node_ids = []
+    stack = [root_node_id]
+    while stack:
+        node_id = stack.pop()
+        tree_node_ids.append(node_id)
+        stack.extend(children[node_id])
+    # every task gets its own copy of the id allocator, so allocation does
+    # not depend on the order in which the pool runs the tasks. Node ids
+    # are distinct across trees, so ids allocated by different copies
+    # cannot collide.
+    return (root_node_id,
+            dict((node_id, children[node_id]) for node_id in tree_node_ids),
+            ctx.plan_node_graph.subgraph(tree_node_ids),
+            copy.deepcopy(ctx.id_allocator),
+            set(ctx.node_instance_ids))
+
+
+def _expand_contained_tree(task):
+    (root_node_id,
+     children,
+     plan_node_graph,
+     id_allocator,
+     node_instance_ids) = task
+    ctx = _ContainedTreeContext(plan_node_graph=plan_node_graph,
+                                id_allocator=id_allocator,
+                                node_instance_ids=node_instance_ids)
+    _build_multi_instance_node_tree(node_id=root_node_id,
+                                    children=children,
+                                    ctx=ctx)
+    return (ctx.deployment_node_graph.nodes(data=True),
+            ctx.deployment_node_graph.edges(data=True))
+
+
+def _build_multi_instance_node_tree(node_id, children, ctx):
+    # depth first walk of the contained tree rooted at node_id, creating
+    # the node instances of each node once per instance of its container.
+    # Items are pushed in reverse, so they are popped in the same order a
+    # recursive walk would visit them.
+    stack = [(node_id, None, None, None, None)]
+    while stack:
+        (node_id,
+         parent_relationship,
+         parent_relationship_index,
+         parent_node_instance_id,
+         current_host_instance_id) = stack.pop()
+        node = ctx.plan_node_graph.node[node_id]['node']
+        containers = _build_and_update_node_instances(
+            ctx=ctx,
+            node=node,
+            parent_node_instance_id=parent_node_instance_id,
+            parent_relationship=parent_relationship,
+            current_host_instance_id=current_host_instance_id)
+        for container in reversed(containers):
+            node_instance = container.node_instance
+            node_instance_id = node_instance['id']
+            relationship_instance = container.relationship_instance
+            new_current_host_instance_id = container.current_host_instance_id
+            ctx.deployment_node_graph.add_node(node_instance_id,
+                                               node=node_instance)
+            if parent_node_instance_id is not None:
+                ctx.deployment_node_graph.add_edge(
+                    node_instance_id, parent_node_instance_id,
+                    Edge(relationship_instance,
+                         parent_relationship_index,
+                         False))
+            for child_node_id in reversed(children[node_id]):
+                edge = ctx.plan_node_graph.targets(child_node_id)[node_id]
+                stack.append((child_node_id,
+                              edge.relationship,
+                              edge.index,
+                              node_instance_id,
+                              new_current_host_instance_id))
 
 
 def _build_and_update_node_instances(ctx,
@@ -461,9 +978,8 @@ def _build_and_update_node_instances(ctx,
         previous_node_instance_ids = [
             instance_id for instance_id in all_previous_node_instance_ids
             if not parent_node_instance_id or
-            (instance_id in ctx.previous_deployment_node_graph and
-             ctx.previous_deployment_node_graph[instance_id].get(
-                 parent_node_instance_id))
+            ctx.previous_deployment_node_graph.has_edge(
+                instance_id, parent_node_instance_id)
         ]
         previous_instances_num = len(previous_node_instance_ids)
         if node_id in ctx.modified_nodes:
@@ -579,10 +1095,10 @@ def _handle_host_instance_id(current_host_instance_id,
 def _handle_connected_to_and_depends_on(ctx):
     relationship_target_ids = _build_previous_target_ids_for_all_to_one(ctx)
     connected_graph = ctx.plan_connected_graph
-    for source_node_id, target_node_id, edge_data in connected_graph.edges(
+    for source_node_id, target_node_id, edge in connected_graph.edges_iter(
             data=True):
-        relationship = edge_data['relationship']
-        index = edge_data['index']
+        relationship = edge.relationship
+        index = edge.index
         connection_type = _verify_and_get_connection_type(relationship)
         source_node_instance_ids = ctx.node_ids_to_node_instance_ids[
             source_node_id]
@@ -603,11 +1119,11 @@ def _handle_connected_to_and_depends_on(ctx):
 def _build_previous_target_ids_for_all_to_one(ctx):
     relationship_target_ids = {}
     if ctx.is_modification:
-        for s, t, e_data in ctx.previous_deployment_node_graph.edges_iter(
+        for s, t, edge in ctx.previous_deployment_node_graph.edges_iter(
                 data=True):
             s_node = ctx.previous_deployment_node_graph.node[s]['node']
             t_node = ctx.previous_deployment_node_graph.node[t]['node']
-            rel = e_data['relationship']
+            rel = edge.relationship
             key = (_node_id_from_node_instance(s_node),
                    _node_id_from_node_instance(t_node),
                    rel['type'])
@@ -684,17 +1200,18 @@ def _add_connected_to_and_depends_on_relationships(
         partitioned_node_instance_ids = [
             (source_node_instance_ids, target_node_instance_ids)]
 
+    # all edges share the plan relationship as a template, the actual
+    # relationship instance of each edge is only created on extraction
+    # (see _edge_relationship_instance), so an all_to_all fan-out between
+    # N and M instances doesn't create N*M relationship instances upfront
+    edge = Edge(relationship, index, True)
     for source_node_instance_ids, target_node_instance_ids in \
             partitioned_node_instance_ids:
-        for source_node_instance_id in source_node_instance_ids:
-            for target_node_instance_id in target_node_instance_ids:
-                relationship_instance = _relationship_instance_copy(
-                    relationship=relationship,
-                    target_node_instance_id=target_node_instance_id)
-                ctx.deployment_node_graph.add_edge(
-                    source_node_instance_id, target_node_instance_id,
-                    relationship=relationship_instance,
-                    index=index)
+        ctx.deployment_node_graph.add_edges_from(
+            ((source_node_instance_id, target_node_instance_id)
+             for source_node_instance_id in source_node_instance_ids
+             for target_node_instance_id in target_node_instance_ids),
+            edge)
 
 
 def _partition_source_and_target_instances(
@@ -735,15 +1252,70 @@ def _build_scaling_groups_map(ctx, node_instance_ids, group):
 
 
 def _node_instance_id(node_id, ctx):
-    new_node_instance_id = '{0}_{1}'.format(node_id, _generate_id())
-    while new_node_instance_id in ctx.node_instance_ids:
-        new_node_instance_id = '{0}_{1}'.format(node_id, _generate_id())
+    new_node_instance_id = ctx.id_allocator.allocate(
+        node_id, ctx.node_instance_ids)
     ctx.node_instance_ids.add(new_node_instance_id)
     return new_node_instance_id
 
 
-def _generate_id(id_len=6):
-    return ''.join(choice(digits + ascii_lowercase) for _ in xrange(id_len))
+def _generate_id(id_len=6, generator=None):
+    generator = generator or choice
+    return ''.join(generator(digits + ascii_lowercase)
+                   for _ in xrange(id_len))
+
+
+class RandomIdAllocator(object):
+    """
+    Allocates node instance ids with a random suffix, retrying on
+    collisions with existing ids (the default).
+
+    :param seed: When given, suffixes are drawn from a dedicated random
+                 generator seeded with it, making allocation reproducible.
+    """
+
+    def __init__(self, seed=None):
+        self._random = random.Random(seed) if seed is not None else None
+
+    def allocate(self, node_id, node_instance_ids):
+        while True:
+            if self._random:
+                suffix = _generate_id(generator=self._random.choice)
+            else:
+                suffix = _generate_id()
+            node_instance_id = '{0}_{1}'.format(node_id, suffix)
+            if node_instance_id not in node_instance_ids:
+                return node_instance_id
+
+
+class CounterIdAllocator(object):
+    """
+    Allocates node instance ids with a per node sequential suffix
+    (e.g. node_000001, node_000002...).
+
+    Allocation is deterministic, and since counters only move forward,
+    existing ids (e.g. during deployment modification) are skipped at most
+    once each, so allocation is amortized O(1) regardless of the number of
+    instances.
+    """
+
+    def __init__(self):
+        self._counters = collections.defaultdict(int)
+
+    def allocate(self, node_id, node_instance_ids):
+        while True:
+            self._counters[node_id] += 1
+            node_instance_id = '{0}_{1}'.format(
+                node_id, _base36(self._counters[node_id]).rjust(6, '0'))
+            if node_instance_id not in node_instance_ids:
+                return node_instance_id
+
+
+def _base36(number):
+    result = ''
+    while number:
+        number, remainder = divmod(number, 36)
+        result = (digits + ascii_lowercase)[remainder] + result
+    return result or '0'
 
 
 def _node_instance_copy(node, node_instance_id):
@@ -773,13 +1345,21 @@ def _relationship_instance_copy(relationship,
     return result
 
 
+def _edge_relationship_instance(edge, target_node_instance_id):
+    if edge.relationship_template:
+        return _relationship_instance_copy(
+            relationship=edge.relationship,
+            target_node_instance_id=target_node_instance_id)
+    return edge.relationship
+
+
 # currently we have decided not to support such relationships
 # until we better understand what semantics are required for such
 # relationships
 def _verify_no_unsupported_relationships(graph):
     for s, t, edge in graph.edges_iter(data=True):
         if not _relationship_type_hierarchy_includes_one_of(
-                edge['relationship'], [
+                edge.relationship, [
                     DEPENDS_ON_REL_TYPE,
                     CONTAINED_IN_REL_TYPE,
                     CONNECTED_TO_REL_TYPE,
@@ -808,6 +1388,21 @@ def _node_id_from_node_instance(instance):
     return instance.get('name') or instance.get('node_id')
 
 
+class _ContainedTreeContext(object):
+    """
+    The part of the context needed to expand a single contained tree of a
+    new deployment, which is all a pool worker gets.
+    """
+
+    is_modification = False
+
+    def __init__(self, plan_node_graph, id_allocator, node_instance_ids):
+        self.plan_node_graph = plan_node_graph
+        self.id_allocator = id_allocator
+        self.node_instance_ids = node_instance_ids
+        self.deployment_node_graph = DiGraph()
+
+
 class Context(object):
 
     def __init__(self,
@@ -815,8 +1410,11 @@ class Context(object):
                  deployment_node_graph,
                  previous_deployment_node_graph=None,
                  previous_deployment_contained_graph=None,
-                 modified_nodes=None):
+                 modified_nodes=None,
+                 id_allocator=None,
+                 reserved_node_instance_ids=None):
         self.plan_node_graph = plan_node_graph
+        self.id_allocator = id_allocator or RandomIdAllocator()
         self.plan_contained_graph = self._build_contained_in_graph(
             plan_node_graph)
         self.plan_connected_graph = self._build_connected_to_and_depends_on_graph(  # noqa
@@ -829,6 +1427,12 @@ class Context(object):
         self.modified_nodes = modified_nodes
         self.node_ids_to_node_instance_ids = collections.defaultdict(set)
         self.node_instance_ids = set()
+        self._containing_groups_memo = {}
+        self._group_ids_memo = {}
+        self._containing_group_instances_memo = {}
+        # ids of node instances outside of the graphs (e.g. when the
+        # modification is scoped), which new ids must not collide with
+        self.node_instance_ids.update(reserved_node_instance_ids or ())
         if self.is_modification:
             for node_instance_id, data in \
                     self.previous_deployment_node_graph.nodes_iter(data=True):
@@ -843,71 +1447,103 @@ class Context(object):
         return self.previous_deployment_node_graph is not None
 
     def minimal_containing_group(self, node_a, node_b):
-        a_groups = self._containing_groups(node_a)
-        b_groups = self._containing_groups(node_b)
-        shared_groups = set(a_groups) & set(b_groups)
-        if not shared_groups:
-            return None
-        return nx.topological_sort(self.plan_contained_graph,
-                                   nbunch=shared_groups)[0]
+        # the groups containing a node form a chain, innermost first
+        b_groups = set(self._containing_groups(node_b))
+        for group in self._containing_groups(node_a):
+            if group in b_groups:
+                return group
+        return None
 
     def _containing_groups(self, node_id):
+        # the groups containing the node (directly or through the nodes and
+        # groups containing it), innermost first, memoized for the node and
+        # its ancestors
         graph = self.plan_contained_graph
-        result = []
-        while True:
-            succ = graph.succ[node_id]
-            if succ:
-                assert len(succ) == 1
-                node_id = succ.keys()[0]
-                if not graph.node[node_id]['node'].get('group'):
-                    continue
-                result.append(node_id)
-            else:
+        memo = self._containing_groups_memo
+        requested_node_id = node_id
+        chain = []
+        groups = ()
+        while node_id not in memo:
+            chain.append(node_id)
+            succ = graph.targets(node_id)
+            if not succ:
                 break
-        return result
+            assert len(succ) == 1
+            node_id = next(iter(succ))
+        else:
+            groups = memo[node_id]
+            if graph.node[node_id]['node'].get('group'):
+                groups = (node_id,) + groups
+        for node_id in reversed(chain):
+            memo[node_id] = groups
+            if graph.node[node_id]['node'].get('group'):
+                groups = (node_id,) + groups
+        return memo[requested_node_id]
 
     def containing_group_id(self, node_instance_id, group_name):
-        graph = self.deployment_contained_graph
-        while True:
-            succ = graph.succ[node_instance_id]
-            if succ:
-                assert len(succ) == 1
-                node_instance_id = succ.keys()[0]
-                node = graph.node[node_instance_id]['node']
-                if not node.get('group'):
-                    continue
-                if _node_id_from_node_instance(node) == group_name:
-                    return node['id']
-            else:
-                return None
+        succ = self.deployment_contained_graph.targets(node_instance_id)
+        if not succ:
+            return None
+        assert len(succ) == 1
+        return self._group_ids(next(iter(succ))).get(group_name)
 
-    @staticmethod
-    def containing_group_instances(instance_id,
+    def _group_ids(self, node_instance_id):
+        # group name to group instance id of the node instance (if it is a
+        # group instance) and all the groups containing it (the innermost
+        # one wins), memoized for the node instance and its ancestors
+        graph = self.deployment_contained_graph
+        memo = self._group_ids_memo
+        chain = []
+        while node_instance_id not in memo:
+            chain.append(node_instance_id)
+            succ = graph.targets(node_instance_id)
+            if not succ:
+                group_ids = {}
+                break
+            assert len(succ) == 1
+            node_instance_id = next(iter(succ))
+        else:
+            group_ids = memo[node_instance_id]
+        for node_instance_id in reversed(chain):
+            node = graph.node[node_instance_id]['node']
+            if node.get('group'):
+                group_ids = dict(group_ids)
+                group_ids[_node_id_from_node_instance(node)] = node['id']
+            memo[node_instance_id] = group_ids
+        return group_ids
+
+    def containing_group_instances(self,
+                                   instance_id,
                                    contained_graph):
-        result = []
-        while True:
-            succ = contained_graph.succ[instance_id]
-            if succ:
-                assert len(succ) == 1
-                node_instance_id = succ.keys()[0]
-                node = contained_graph.node[node_instance_id]['node']
-                instance_id = node['id']
-                result.append({
-                    'name': _node_id_from_node_instance(node),
-                    'id': instance_id
-                })
-                if not node.get('group'):
-                    return result[:-1], result[-1]
-            else:
-                return result, None
+        # memoized per contained graph as (name, id) tuples, fresh dicts
+        # are returned as callers store them in node instances
+        memo = self._containing_group_instances_memo.setdefault(
+            id(contained_graph), {})
+        chain = []
+        while instance_id not in memo:
+            succ = contained_graph.targets(instance_id)
+            if not succ:
+                memo[instance_id] = ((), None)
+                break
+            assert len(succ) == 1
+            node = contained_graph.node[next(iter(succ))]['node']
+            entry = (_node_id_from_node_instance(node), node['id'])
+            if not node.get('group'):
+                memo[instance_id] = ((), entry)
+                break
+            chain.append((instance_id, entry))
+            instance_id = node['id']
+        groups, parent = memo[instance_id]
+        for contained_instance_id, entry in reversed(chain):
+            groups = (entry,) + groups
+            memo[contained_instance_id] = (groups, parent)
+        if parent:
+            parent = {'name': parent[0], 'id': parent[1]}
+        return ([{'name': name, 'id': group_id} for name, group_id in groups],
+                parent)
 
     def restore_plan_node_graph(self):
-        for _, data in self.plan_node_graph.nodes_iter(data=True):
-            node = data['node']
-            for relationship in node.get('relationships', []):
-                replaced = relationship.pop('replaced', None)
-                if replaced:
-                    relationship['target_id'] = replaced
+        restore_node_graph(self.plan_node_graph)
 
     def _build_connected_to_and_depends_on_graph(self, graph):
         return self._build_graph_by_relationship_types(
@@ -925,24 +1561,25 @@ class Context(object):
             exclude_types=[])
         # don't forget to include nodes in this graph that no one is contained
         # in them (these will be considered 1 node trees)
-        result.add_nodes_from(graph.nodes_iter(data=True))
+        for node_id, data in graph.nodes_iter(data=True):
+            result.add_node(node_id, data)
         return result
 
     @staticmethod
     def _build_graph_by_relationship_types(graph,
                                            build_from_types,
                                            exclude_types):
-        relationship_base_graph = nx.DiGraph()
-        for source, target, edge_data in graph.edges_iter(data=True):
+        relationship_base_graph = DiGraph()
+        for source, target, edge in graph.edges_iter(data=True):
             include_edge = (
                 _relationship_type_hierarchy_includes_one_of(
-                    edge_data['relationship'], build_from_types) and not
+                    edge.relationship, build_from_types) and not
                 _relationship_type_hierarchy_includes_one_of(
-                    edge_data['relationship'], exclude_types))
+                    edge.relationship, exclude_types))
             if include_edge:
                 relationship_base_graph.add_node(source, graph.node[source])
                 relationship_base_graph.add_node(target, graph.node[target])
-                relationship_base_graph.add_edge(source, target, edge_data)
+                relationship_base_graph.add_edge(source, target, edge)
         return relationship_base_graph
 
 
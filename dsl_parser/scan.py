@@ -27,7 +27,8 @@ def scan_properties(value,
                     context=None,
                     path='',
                     replace=False,
-                    recursive=True):
+                    recursive=True,
+                    value_filter=None):
     """
     Scans properties dict recursively and applies the provided handler
     method for each property.
@@ -41,35 +42,73 @@ def scan_properties(value,
     * path - current property path.
     * replace - replace current dict/list values of scanned properties.
 
+    The scan is iterative (nested properties do not consume stack frames)
+    and property paths are only built for values the handler is actually
+    applied to. When replacing, values replaced by the handler are not
+    scanned further (nor is the handler's result).
+
     :param value: The properties container (dict/list).
     :param handler: A method for applying for to each property.
     :param path: The properties base path (for debugging purposes).
+    :param value_filter: An optional predicate; the handler is only applied
+                         to values it accepts, e.g. ``functions.is_function``
+                         for handlers that only process intrinsic functions.
+                         It does not prune the scan: nested values of all
+                         containers are still scanned.
     """
     if isinstance(value, dict):
-        for k, v in value.iteritems():
-            current_path = '{0}.{1}'.format(path, k)
-            result = handler(v, scope, context, current_path)
-            if replace and result != v:
-                value[k] = result
-            if recursive:
-                scan_properties(v, handler,
-                                scope=scope,
-                                context=context,
-                                path=current_path,
-                                replace=replace)
+        frames = [[value, value.iteritems(), True, path]]
     elif isinstance(value, list):
-        for index, item in enumerate(value):
-            current_path = '{0}[{1}]'.format(path, index)
-            result = handler(item, scope, context, current_path)
-            if replace and result != item:
-                value[index] = result
-            if recursive:
-                scan_properties(item,
-                                handler,
-                                scope=scope,
-                                context=context,
-                                path=path,
-                                replace=replace)
+        frames = [[value, enumerate(value), False, path]]
+    else:
+        return
+    while frames:
+        frame = frames[-1]
+        container, items, is_dict, frame_path = frame
+        # iterate the top most container until a nested container is found,
+        # which is then scanned before resuming this (resumable) iterator
+        for key, item in items:
+            item_path = None
+            if value_filter is None or value_filter(item):
+                if frame_path.__class__ is tuple:
+                    frame_path = _frame_path(frame)
+                if is_dict:
+                    item_path = '{0}.{1}'.format(frame_path, key)
+                else:
+                    item_path = '{0}[{1}]'.format(frame_path, key)
+                result = handler(item, scope, context, item_path)
+                if replace and result != item:
+                    # the replaced item is no longer part of the scanned
+                    # value, so it is not scanned either
+                    container[key] = result
+                    continue
+            if recursive and isinstance(item, (dict, list)):
+                # nested list items are scanned with their list's path
+                if not is_dict:
+                    item_path = frame_path
+                elif item_path is None:
+                    item_path = (frame, key)
+                if isinstance(item, dict):
+                    frames.append([item, item.iteritems(), True, item_path])
+                else:
+                    frames.append([item, enumerate(item), False, item_path])
+                break
+        else:
+            frames.pop()
+
+
+def _frame_path(frame):
+    # a frame path is kept as a (parent_frame, key) tuple until a handler
+    # actually needs it, and is then formatted once and memoized
+    unresolved = []
+    while frame[3].__class__ is tuple:
+        unresolved.append(frame)
+        frame = frame[3][0]
+    path = frame[3]
+    for frame in reversed(unresolved):
+        path = '{0}.{1}'.format(path, frame[3][1])
+        frame[3] = path
+    return path
 
 
 def _scan_operations(operations,
@@ -77,7 +116,8 @@ def _scan_operations(operations,
                      scope=None,
                      context=None,
                      path='',
-                     replace=False):
+                     replace=False,
+                     value_filter=None):
     for name, definition in operations.iteritems():
         if isinstance(definition, dict) and 'inputs' in definition:
             context = context.copy() if context else {}
@@ -87,16 +127,21 @@ def _scan_operations(operations,
                             scope=scope,
                             context=context,
                             path='{0}.{1}.inputs'.format(path, name),
-                            replace=replace)
+                            replace=replace,
+                            value_filter=value_filter)
 
 
-def scan_node_operation_properties(node_template, handler, replace=False):
+def scan_node_operation_properties(node_template,
+                                   handler,
+                                   replace=False,
+                                   value_filter=None):
     _scan_operations(node_template['operations'],
                      handler,
                      scope=NODE_TEMPLATE_SCOPE,
                      context=node_template,
                      path='{0}.operations'.format(node_template['name']),
-                     replace=replace)
+                     replace=replace,
+                     value_filter=value_filter)
     for r in node_template.get('relationships', []):
         context = {'node_template': node_template, 'relationship': r}
         _scan_operations(r.get('source_operations', {}),
@@ -105,17 +150,19 @@ def scan_node_operation_properties(node_template, handler, replace=False):
                          context=context,
                          path='{0}.{1}'.format(node_template['name'],
                                                r['type']),
-                         replace=replace)
+                         replace=replace,
+                         value_filter=value_filter)
         _scan_operations(r.get('target_operations', {}),
                          handler,
                          scope=NODE_TEMPLATE_RELATIONSHIP_SCOPE,
                          context=context,
                          path='{0}.{1}'.format(node_template['name'],
                                                r['type']),
-                         replace=replace)
+                         replace=replace,
+                         value_filter=value_filter)
 
 
-def scan_service_template(plan, handler, replace=False):
+def scan_service_template(plan, handler, replace=False, value_filter=None):
     for node_template in plan.node_templates:
         scan_properties(node_template['properties'],
                         handler,
@@ -123,7 +170,8 @@ def scan_service_template(plan, handler, replace=False):
                         context=node_template,
                         path='{0}.properties'.format(
                             node_template['name']),
-                        replace=replace)
+                        replace=replace,
+                        value_filter=value_filter)
         for name, capability in node_template.get('capabilities', {}).items():
             scan_properties(capability.get('properties', {}),
                             handler,
@@ -132,22 +180,28 @@ def scan_service_template(plan, handler, replace=False):
                             path='{0}.capabilities.{1}'.format(
                                 node_template['name'],
                                 name),
-                            replace=replace)
-        scan_node_operation_properties(node_template, handler, replace=replace)
+                            replace=replace,
+                            value_filter=value_filter)
+        scan_node_operation_properties(node_template,
+                                       handler,
+                                       replace=replace,
+                                       value_filter=value_filter)
     for output_name, output in plan.outputs.iteritems():
         scan_properties(output,
                         handler,
                         scope=OUTPUTS_SCOPE,
                         context=plan.outputs,
                         path='outputs.{0}'.format(output_name),
-                        replace=replace)
+                        replace=replace,
+                        value_filter=value_filter)
     for policy_name, policy in plan.get('policies', {}).items():
         scan_properties(policy.get('properties', {}),
                         handler,
                         scope=POLICIES_SCOPE,
                         context=policy,
                         path='policies.{0}.properties'.format(policy_name),
-                        replace=replace)
+                        replace=replace,
+                        value_filter=value_filter)
     for group_name, scaling_group in plan.get('scaling_groups', {}).items():
         scan_properties(scaling_group.get('properties', {}),
                         handler,
@@ -155,4 +209,5 @@ def scan_service_template(plan, handler, replace=False):
                         context=scaling_group,
                         path='scaling_groups.{0}.properties'.format(
                             group_name),
-                        replace=replace)
+                        replace=replace,
+                        value_filter=value_filter)
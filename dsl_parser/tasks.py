@@ -33,13 +33,15 @@ def parse_dsl(dsl_location,
               resources_base_url,
               resolver=None,
               validate_version=True,
-              additional_resources=()):
+              additional_resources=(),
+              compact_plan=False):
     return parser.parse_from_url(
             dsl_url=dsl_location,
             resources_base_url=resources_base_url,
             resolver=resolver,
             validate_version=validate_version,
-            additional_resource_sources=additional_resources)
+            additional_resource_sources=additional_resources,
+            compact_plan=compact_plan)
 
 
 def _set_plan_inputs(plan, inputs=None):
@@ -72,7 +74,10 @@ def _set_plan_inputs(plan, inputs=None):
 
 def _process_functions(plan):
     handler = functions.plan_evaluation_handler(plan)
-    scan.scan_service_template(plan, handler, replace=True)
+    scan.scan_service_template(plan,
+                               handler,
+                               replace=True,
+                               value_filter=functions.is_function)
 
 
 def prepare_deployment_plan(plan, inputs=None, **kwargs):
@@ -82,4 +87,5 @@ def prepare_deployment_plan(plan, inputs=None, **kwargs):
     plan = models.Plan(copy.deepcopy(plan))
     _set_plan_inputs(plan, inputs)
     _process_functions(plan)
-    return multi_instance.create_deployment_plan(plan)
+    # the plan was copied above, no need for another copy
+    return multi_instance.create_deployment_plan(plan, copy_plan=False)
@@ -1045,6 +1045,28 @@ class NodeTemplateNodeTypeOperationMergerTest(testtools.TestCase):
             expected_merged_operation=expected_merged_operation
         )
 
+    def test_operation_mapping_with_invalid_function_input(self):
+
+        node_template_operation = raw_operation_mapping(
+            inputs={
+                'key': {'get_input': [1, 2]}
+            }
+        )
+        node_type_operation = raw_operation_mapping(
+            implementation='mock.tasks.create',
+            inputs={
+                'key': {
+                    'type': 'integer'
+                }
+            }
+        )
+
+        merger = NodeTemplateNodeTypeOperationMerger(
+            overriding_operation=node_template_operation,
+            overridden_operation=node_type_operation
+        )
+        self.assertRaises(ValueError, merger.merge)
+
 
 class NodeTypeNodeTypeOperationMergerTest(testtools.TestCase):
 
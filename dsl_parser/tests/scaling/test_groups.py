@@ -2437,6 +2437,54 @@ class TestMultiInstanceGroups(scaling.BaseTestMultiInstance):
                 }
             })
 
+    def test_containing_group_lookups(self):
+        def node(node_id):
+            return {'id': node_id, 'name': node_id,
+                    'number_of_instances': 2,
+                    'deploy_number_of_instances': 2,
+                    'min_number_of_instances': 0,
+                    'max_number_of_instances': -1}
+
+        def group(members):
+            return {'members': members,
+                    'properties': {'current_instances': 2,
+                                   'default_instances': 2,
+                                   'min_instances': 0,
+                                   'max_instances': -1}}
+        plan_node_graph = rel_graph.build_node_graph(
+            nodes=[node('node1'), node('node2')],
+            scaling_groups={'outer': group(['middle', 'node2']),
+                            'middle': group(['inner']),
+                            'inner': group(['node1'])})
+        graph, ctx = rel_graph.build_deployment_node_graph(plan_node_graph)
+        contained_graph = ctx.deployment_contained_graph
+        nx_contained_graph = _networkx_graph(contained_graph)
+
+        def walk(instance_id):
+            result = []
+            for ancestor_id in nx.topological_sort(
+                    nx_contained_graph,
+                    nbunch=nx.descendants(nx_contained_graph, instance_id)):
+                result.append((contained_graph.node[ancestor_id]['node'][
+                    'name'], ancestor_id))
+            return result
+
+        for instance_id, data in graph.nodes_iter(data=True):
+            ancestors = walk(instance_id)
+            for group_name in ['outer', 'middle', 'inner']:
+                expected_id = dict(ancestors).get(group_name)
+                self.assertEqual(expected_id, ctx.containing_group_id(
+                    instance_id, group_name))
+            groups, parent = ctx.containing_group_instances(
+                instance_id, contained_graph)
+            self.assertEqual(
+                [{'name': name, 'id': ancestor_id}
+                 for name, ancestor_id in ancestors], groups)
+            self.assertIsNone(parent)
+            self.assertIsNot(groups, ctx.containing_group_instances(
+                instance_id, contained_graph)[0])
+        self.assertEqual(2 + 4 + 8 + 2 * 8 + 2 * 2, graph.number_of_nodes())
+
     def _test(
             self,
             groups,
@@ -2827,6 +2875,7 @@ class TestMultiInstanceGroups(scaling.BaseTestMultiInstance):
         _, contained_graph = rel_graph.build_previous_deployment_node_graph(
             plan_node_graph=plan_graph,
             previous_node_instances=node_instances_copy)
+        contained_graph = _networkx_graph(contained_graph)
 
         # for modification tests, we want to maintain weakly connected
         # components, for example, if a db is contained in a host and that
@@ -3167,3 +3216,12 @@ class TestMultiInstanceGroups(scaling.BaseTestMultiInstance):
 
         # convert to yaml a parse a multi instance plan
         return self.parse_multi(yaml.safe_dump(blueprint))
+
+
+def _networkx_graph(graph):
+    # rel_graph graphs only support what rel_graph needs, the assertions
+    # use networkx algorithms
+    result = nx.DiGraph()
+    result.add_nodes_from(graph.nodes_iter(data=True))
+    result.add_edges_from(graph.edges_iter())
+    return result
@@ -13,6 +13,11 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
+import copy
+import json
+
+from dsl_parser import multi_instance
+from dsl_parser import rel_graph
 from dsl_parser.tests import scaling
 
 
@@ -35,6 +40,262 @@ class TestMultiInstanceModify(scaling.BaseTestMultiInstance):
             self.assertIn('host_', instance['id'])
             self.assertEqual(instance['host_id'], instance['id'])
 
+    def test_modified_single_node_added_with_id_allocator(self):
+        yaml = self.BASE_BLUEPRINT + """
+    host:
+        type: cloudify.nodes.Compute
+"""
+        plan = multi_instance.create_deployment_plan(
+            self.parse_1_3(yaml),
+            id_allocator=rel_graph.CounterIdAllocator())
+        modification = multi_instance.modify_deployment(
+            nodes=plan['nodes'],
+            previous_nodes=plan['nodes'],
+            previous_node_instances=plan['node_instances'],
+            modified_nodes={'host': {'instances': 3}},
+            scaling_groups=plan['scaling_groups'],
+            id_allocator=rel_graph.CounterIdAllocator())
+        self._assert_modification(modification, 2, 0, 2, 0)
+        self.assertEqual(
+            ['host_000002', 'host_000003'],
+            sorted(i['id'] for i in modification['added_and_related']))
+
+    def test_graph_diff(self):
+        def graph(edges):
+            result = rel_graph.DiGraph()
+            for source, target in edges:
+                for node_instance_id in [source, target]:
+                    result.add_node(node_instance_id,
+                                    node={'id': node_instance_id})
+                result.add_edge(source, target, rel_graph.Edge(
+                    relationship={'target_id': target},
+                    index=0,
+                    relationship_template=False))
+            return result
+        previous = graph([('a', 'b'), ('c', 'b'), ('c', 'd')])
+        new = graph([('a', 'b'), ('c', 'e'), ('e', 'b'), ('f', 'b')])
+        graphs = copy.deepcopy((previous, new))
+
+        # edges into nodes are found through their sources
+        for g, sources in [(new, ['a', 'e', 'f']),
+                           (new.copy(), ['a', 'e', 'f']),
+                           (new.subgraph(['b', 'c', 'e']), ['e'])]:
+            self.assertEqual(
+                set((source, 'b') for source in sources),
+                set((source, target) for source, target, _
+                    in g.in_edges(['b'])))
+        attributes = {'modification': 'added'}
+
+        added = rel_graph._graph_diff(new, previous, attributes)
+        self.assertEqual(set(['e', 'f', 'c', 'b']), set(added.nodes()))
+        self.assertEqual(set([('c', 'e'), ('e', 'b'), ('f', 'b')]),
+                         set(added.edges()))
+        for node_instance_id in ['e', 'f']:
+            self.assertEqual(attributes, added.node[node_instance_id][
+                'node_instance_attributes'])
+        for node_instance_id in ['c', 'b']:
+            self.assertNotIn('node_instance_attributes',
+                             added.node[node_instance_id])
+
+        extended = rel_graph._graph_diff_relationships(
+            new, previous, attributes)
+        self.assertEqual(set([('c', 'e')]), set(extended.edges()))
+        self.assertIn('node_instance_attributes', extended.node['c'])
+        self.assertNotIn('node_instance_attributes', extended.node['e'])
+
+        reduced = rel_graph._graph_diff_relationships(
+            previous, new, attributes)
+        self.assertEqual(set([('c', 'b'), ('c', 'd')]), set(reduced.edges()))
+
+        # the diffed graphs are left as is
+        for expected, actual in zip(graphs, (previous, new)):
+            self.assertEqual(expected.node, actual.node)
+            self.assertEqual(expected.edges(data=True),
+                             actual.edges(data=True))
+
+    def test_modified_with_graph_snapshot(self):
+        yaml = self.BASE_BLUEPRINT + """
+    host:
+        type: cloudify.nodes.Compute
+        capabilities:
+            scalable:
+                properties:
+                    default_instances: 2
+    db:
+        type: db
+        relationships:
+            -   type: cloudify.relationships.contained_in
+                target: host
+    webserver:
+        type: webserver
+        relationships:
+            -   type: cloudify.relationships.connected_to
+                target: db
+"""
+        plan = multi_instance.create_deployment_plan(self.parse_1_3(yaml),
+                                                     graph_snapshot=True)
+        snapshot = json.loads(json.dumps(plan['deployment_graph_snapshot']))
+        self.assertEqual(
+            snapshot,
+            json.loads(json.dumps(multi_instance.deployment_graph_snapshot(
+                nodes=plan['nodes'],
+                scaling_groups=plan['scaling_groups'],
+                node_instances=plan['node_instances']))))
+        stale_snapshot = copy.deepcopy(snapshot)
+        stale_snapshot['node_instances'].pop()
+
+        for previous_graph_snapshot in [None, snapshot, stale_snapshot]:
+            previous = copy.deepcopy(plan)
+            graph, contained_graph = \
+                rel_graph.build_previous_deployment_node_graph(
+                    plan_node_graph=rel_graph.build_node_graph(
+                        previous['nodes'], previous['scaling_groups']),
+                    previous_node_instances=previous['node_instances'],
+                    snapshot=previous_graph_snapshot)
+            self.assertEqual(5, graph.number_of_nodes())
+            self.assertEqual(4, graph.number_of_edges())
+            self.assertEqual(5, contained_graph.number_of_nodes())
+            self.assertEqual(2, contained_graph.number_of_edges())
+
+            modification = multi_instance.modify_deployment(
+                nodes=previous['nodes'],
+                previous_nodes=previous['nodes'],
+                previous_node_instances=previous['node_instances'],
+                modified_nodes={'host': {'instances': 3}},
+                scaling_groups=previous['scaling_groups'],
+                previous_graph_snapshot=previous_graph_snapshot)
+            self._assert_modification(modification, 3, 0, 2, 0)
+            self.assertEqual(1, len(modification['extended_and_related']))
+
+    def test_graph_snapshot_of_fewer_relationships(self):
+        yaml = self.BASE_BLUEPRINT + """
+    host:
+        type: cloudify.nodes.Compute
+    db:
+        type: db
+        relationships:
+            -   type: cloudify.relationships.contained_in
+                target: host
+    webserver:
+        type: webserver
+        relationships:
+            -   type: cloudify.relationships.connected_to
+                target: db
+            -   type: cloudify.relationships.connected_to
+                target: host
+"""
+        plan = self.parse_multi(yaml)
+        # the snapshot was taken before the relationship to host was added
+        node_instances = copy.deepcopy(plan['node_instances'])
+        for node_instance in node_instances:
+            if node_instance['name'] == 'webserver':
+                node_instance['relationships'].pop()
+        stale_snapshot = json.loads(json.dumps(
+            multi_instance.deployment_graph_snapshot(
+                nodes=plan['nodes'],
+                scaling_groups=plan['scaling_groups'],
+                node_instances=node_instances)))
+
+        def edges(snapshot):
+            graph, _ = rel_graph.build_previous_deployment_node_graph(
+                plan_node_graph=rel_graph.build_node_graph(
+                    plan['nodes'], plan['scaling_groups']),
+                previous_node_instances=copy.deepcopy(
+                    plan['node_instances']),
+                snapshot=snapshot)
+            return set((source, target, edge.relationship['type'])
+                       for source, target, edge in graph.edges(data=True))
+
+        self.assertEqual(3, len(edges(None)))
+        self.assertEqual(edges(None), edges(stale_snapshot))
+
+    def test_modification_scope(self):
+        yaml = self.BASE_BLUEPRINT + """
+    host1:
+        type: cloudify.nodes.Compute
+    db1:
+        type: db
+        relationships:
+            -   type: cloudify.relationships.contained_in
+                target: host1
+    host2:
+        type: cloudify.nodes.Compute
+    webserver2:
+        type: webserver
+        relationships:
+            -   type: cloudify.relationships.contained_in
+                target: host2
+            -   type: cloudify.relationships.connected_to
+                target: db1
+    host3:
+        type: cloudify.nodes.Compute
+"""
+        plan = self.parse_multi(yaml)
+
+        def scope(modified_nodes):
+            return rel_graph.modification_scope(
+                nodes=plan['nodes'],
+                scaling_groups=plan['scaling_groups'],
+                modified_nodes=modified_nodes,
+                previous_nodes=plan['nodes'],
+                previous_node_instances=plan['node_instances'])
+
+        self.assertEqual(set(['host3']), scope({'host3': {'instances': 2}}))
+        self.assertEqual(set(['host1', 'db1', 'host2', 'webserver2']),
+                         scope({'host1': {'instances': 2}}))
+        # previous node instances that don't match the plan are in scope
+        plan['node_instances'] = [i for i in plan['node_instances']
+                                  if i['name'] != 'host3']
+        self.assertEqual(set(['host3']), scope({}))
+
+    def test_modified_incremental(self):
+        yaml = self.BASE_BLUEPRINT + """
+    host1:
+        type: cloudify.nodes.Compute
+    db1:
+        type: db
+        relationships:
+            -   type: cloudify.relationships.contained_in
+                target: host1
+    host2:
+        type: cloudify.nodes.Compute
+        capabilities:
+            scalable:
+                properties:
+                    default_instances: 2
+    webserver2:
+        type: webserver
+        relationships:
+            -   type: cloudify.relationships.contained_in
+                target: host2
+            -   type: cloudify.relationships.connected_to
+                target: db1
+"""
+        plan = self.parse_multi(yaml)
+        for modified_nodes, expected_counts in [
+                ({'host1': {'instances': 2}}, (4, 0, 2, 0)),
+                ({'host2': {'instances': 1}}, (0, 3, 0, 2))]:
+            modifications = [
+                multi_instance.modify_deployment(
+                    nodes=plan['nodes'],
+                    previous_nodes=plan['nodes'],
+                    previous_node_instances=plan['node_instances'],
+                    modified_nodes=modified_nodes,
+                    scaling_groups=plan['scaling_groups'],
+                    incremental=incremental)
+                for incremental in (True, False)]
+            for modification in modifications:
+                self._assert_modification(modification, *expected_counts)
+            incremental, full = modifications
+            for key, node_instances in full.items():
+                self.assertEqual(
+                    sorted((i['name'], i.get('modification'),
+                            len(i['relationships']))
+                           for i in node_instances),
+                    sorted((i['name'], i.get('modification'),
+                            len(i['relationships']))
+                           for i in incremental[key]))
+
     def test_modified_single_no_actual_modification(self):
         yaml = self.BASE_BLUEPRINT + """
     host:
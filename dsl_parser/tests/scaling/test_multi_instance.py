@@ -13,12 +13,17 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
+import copy
 import itertools
+import multiprocessing
 import random
+from multiprocessing.pool import ThreadPool
 
 from mock import patch
 
 from dsl_parser import exceptions
+from dsl_parser import multi_instance
+from dsl_parser import rel_graph
 from dsl_parser.tests import scaling
 
 
@@ -549,3 +554,237 @@ policies:
 """
         self.assertRaises(exceptions.UnsupportedAllToOneInGroup,
                           self.parse_multi, blueprint)
+
+    def test_create_deployment_plan_copy_plan(self):
+        yaml = self.BASE_BLUEPRINT + """
+    host:
+        type: cloudify.nodes.Compute
+    db:
+        type: db
+        relationships:
+            -   type: cloudify.relationships.contained_in
+                target: host
+groups:
+    group:
+        members: [db]
+policies:
+    policy:
+        type: cloudify.policies.scaling
+        targets: [group]
+"""
+        plan = self.parse_1_3(yaml)
+        original_plan = copy.deepcopy(plan)
+
+        deployment_plan = multi_instance.create_deployment_plan(plan)
+        self.assertEqual(original_plan, plan)
+        self.assertNotIn('node_instances', plan)
+        self.assertIsNot(plan['nodes'], deployment_plan['nodes'])
+
+        consumed_deployment_plan = multi_instance.create_deployment_plan(
+            plan, copy_plan=False)
+        self.assertNotIn('node_instances', plan)
+        self.assertIs(plan['nodes'], consumed_deployment_plan['nodes'])
+        self.assertEqual(original_plan['nodes'],
+                         consumed_deployment_plan['nodes'])
+        self.assertEqual(
+            len(deployment_plan['node_instances']),
+            len(consumed_deployment_plan['node_instances']))
+
+    def test_iter_deployment_node_instances(self):
+        yaml = self.BASE_BLUEPRINT + """
+    host:
+        type: cloudify.nodes.Compute
+        capabilities:
+            scalable:
+                properties:
+                    default_instances: 2
+    db:
+        type: db
+        relationships:
+            -   type: cloudify.relationships.contained_in
+                target: host
+    webserver:
+        type: webserver
+        relationships:
+            -   type: cloudify.relationships.connected_to
+                target: db
+"""
+        plan = self.parse_1_3(yaml)
+        original_plan = copy.deepcopy(plan)
+        expected = multi_instance.create_deployment_plan(plan)[
+            'node_instances']
+
+        def summary(node_instances):
+            return sorted(
+                (i['name'],
+                 i.get('host_id', '').split('_')[0],
+                 sorted(r['target_name'] for r in i['relationships']))
+                for i in node_instances)
+
+        node_instances = multi_instance.iter_deployment_node_instances(plan)
+        self.assertFalse(isinstance(node_instances, list))
+        self.assertEqual(summary(expected), summary(node_instances))
+        self.assertEqual(original_plan, plan)
+
+        chunks = list(multi_instance.iter_deployment_node_instances(
+            plan, chunk_size=2))
+        self.assertEqual([2, 2, 1], [len(chunk) for chunk in chunks])
+        self.assertEqual(summary(expected),
+                         summary(itertools.chain(*chunks)))
+
+    def test_all_to_all_relationship_instances_not_shared(self):
+        yaml = self.BASE_BLUEPRINT + """
+    host:
+        type: cloudify.nodes.Compute
+        capabilities:
+            scalable:
+                properties:
+                    default_instances: 3
+    webserver:
+        type: webserver
+        capabilities:
+            scalable:
+                properties:
+                    default_instances: 2
+        relationships:
+            -   type: cloudify.relationships.connected_to
+                target: host
+"""
+        plan = self.parse_multi(yaml)
+        host_ids = sorted(self._node_ids(self._nodes_by_name(
+            plan['node_instances'], 'host')))
+        webservers = self._nodes_by_name(plan['node_instances'], 'webserver')
+        self.assertEqual(2, len(webservers))
+        relationships = [r for w in webservers for r in w['relationships']]
+        self.assertEqual(6, len(relationships))
+        self.assertEqual(6, len(set(id(r) for r in relationships)))
+        for webserver in webservers:
+            self.assertEqual(
+                host_ids,
+                sorted(r['target_id'] for r in webserver['relationships']))
+            for relationship in webserver['relationships']:
+                self.assertEqual({
+                    'type': 'cloudify.relationships.connected_to',
+                    'target_name': 'host',
+                    'target_id': relationship['target_id']
+                }, relationship)
+
+    def test_id_allocators(self):
+        yaml = self.BASE_BLUEPRINT + """
+    host:
+        type: cloudify.nodes.Compute
+        capabilities:
+            scalable:
+                properties:
+                    default_instances: 3
+"""
+        plan = self.parse_1_3(yaml)
+
+        def ids(id_allocator):
+            deployment_plan = multi_instance.create_deployment_plan(
+                plan, id_allocator=id_allocator)
+            return sorted(self._node_ids(deployment_plan['node_instances']))
+
+        self.assertEqual(['host_000001', 'host_000002', 'host_000003'],
+                         ids(rel_graph.CounterIdAllocator()))
+        self.assertEqual(ids(rel_graph.RandomIdAllocator(seed=1)),
+                         ids(rel_graph.RandomIdAllocator(seed=1)))
+
+    def test_counter_id_allocator_skips_existing_ids(self):
+        allocator = rel_graph.CounterIdAllocator()
+        existing_ids = set(['node_000001', 'node_000002', 'node_00000a'])
+        allocated_ids = [allocator.allocate('node', existing_ids)
+                         for _ in range(10)]
+        self.assertEqual(10, len(set(allocated_ids)))
+        self.assertFalse(existing_ids & set(allocated_ids))
+        self.assertEqual('node_000003', allocated_ids[0])
+        self.assertEqual('other_000001', allocator.allocate('other', set()))
+
+    def test_deep_containment_hierarchy(self):
+        depth = 2000
+        nodes = []
+        for level in range(depth):
+            node_id = 'node{0}'.format(level)
+            relationships = []
+            if level:
+                relationships.append({
+                    'type': 'cloudify.relationships.contained_in',
+                    'type_hierarchy': ['cloudify.relationships.depends_on',
+                                       'cloudify.relationships.contained_in'],
+                    'target_id': 'node{0}'.format(level - 1)
+                })
+            nodes.append({
+                'id': node_id,
+                'name': node_id,
+                'host_id': 'node0',
+                'number_of_instances': 1,
+                'deploy_number_of_instances': 1,
+                'min_number_of_instances': 0,
+                'max_number_of_instances': -1,
+                'relationships': relationships
+            })
+        plan = multi_instance.create_deployment_plan(
+            {'nodes': nodes, 'scaling_groups': {}})
+        node_instances = dict((i['name'], i) for i in plan['node_instances'])
+        self.assertEqual(depth, len(node_instances))
+        host_id = node_instances['node0']['id']
+        for level in range(1, depth):
+            node_instance = node_instances['node{0}'.format(level)]
+            self.assertEqual(host_id, node_instance['host_id'])
+            self.assertEqual(
+                node_instances['node{0}'.format(level - 1)]['id'],
+                node_instance['relationships'][0]['target_id'])
+
+    def test_create_deployment_plan_with_pool(self):
+        yaml = self.BASE_BLUEPRINT + """
+    host1:
+        type: cloudify.nodes.Compute
+        capabilities:
+            scalable:
+                properties:
+                    default_instances: 2
+    db:
+        type: db
+        relationships:
+            -   type: cloudify.relationships.contained_in
+                target: host1
+    host2:
+        type: cloudify.nodes.Compute
+    webserver:
+        type: webserver
+        capabilities:
+            scalable:
+                properties:
+                    default_instances: 2
+        relationships:
+            -   type: cloudify.relationships.contained_in
+                target: host2
+            -   type: cloudify.relationships.connected_to
+                target: db
+    host3:
+        type: cloudify.nodes.Compute
+groups:
+    group:
+        members: [host2, host3]
+policies:
+    policy:
+        type: cloudify.policies.scaling
+        targets: [group]
+        properties:
+            default_instances: 2
+"""
+        plan = self.parse_1_3(yaml)
+
+        def node_instances(pool=None):
+            deployment_plan = multi_instance.create_deployment_plan(
+                plan, id_allocator=rel_graph.CounterIdAllocator(), pool=pool)
+            return sorted(deployment_plan['node_instances'],
+                          key=lambda i: i['id'])
+
+        expected = node_instances()
+        self.assertEqual(12, len(expected))
+        for pool in [ThreadPool(4), multiprocessing.Pool(2)]:
+            try:
+                self.assertEqual(expected, node_instances(pool))
+            finally:
+                pool.terminate()
@@ -17,6 +17,7 @@ import yaml
 
 from dsl_parser import constants
 from dsl_parser import exceptions
+from dsl_parser.elements import policies
 from dsl_parser.tests.abstract_test_parser import AbstractTestParser
 
 
@@ -347,6 +348,21 @@ class TestRemovedContainedInMember(AbstractTestParser):
         }
         self.assert_removal(groups, nodes, expected)
 
+    def test_removed_contained_in_member9(self):
+        groups = {
+            'group': ['node1', 'node2', 'node3', 'node4']
+        }
+        nodes = {
+            'node1': None,
+            'node2': None,
+            'node3': 'node1',
+            'node4': 'node2'
+        }
+        expected = {
+            'group': ['node1', 'node2']
+        }
+        self.assert_removal(groups, nodes, expected)
+
     def assert_removal(self, groups, nodes, expected):
         blueprint = base_blueprint(groups=groups, nodes=nodes)
         plan = self.parse(blueprint)
@@ -658,6 +674,55 @@ class TestScalingPoliciesAndGroupsValidation(AbstractTestParser):
             groups=groups,
             nodes=nodes)
 
+    def test_validate_groups_with_many_members(self):
+        hosts_count = 1000
+        node_templates = []
+        members = []
+        for i in range(hosts_count):
+            host_id = 'host{0}'.format(i)
+            node_id = 'node{0}'.format(i)
+            node_templates.append({'id': host_id, 'relationships': []})
+            node_templates.append({
+                'id': node_id,
+                'relationships': [{
+                    'type_hierarchy': [constants.CONTAINED_IN_REL_TYPE],
+                    'target_id': host_id
+                }]
+            })
+            members.extend([host_id, node_id])
+
+        def validate(group_members):
+            scaling_groups = {
+                'group': {'members': ['group2']},
+                'group2': {'members': group_members}
+            }
+            policies.Policies(context=None, initial_value={}).\
+                _validate_and_update_groups(scaling_groups, node_templates)
+            return scaling_groups
+
+        scaling_groups = validate(members[:])
+        self.assertEqual(['host{0}'.format(i) for i in range(hosts_count)],
+                         scaling_groups['group2']['members'])
+        try:
+            validate(members[1:])
+            self.fail()
+        except exceptions.DSLParsingLogicException as e:
+            self.assertEqual(exceptions.ERROR_NON_CONTAINED_GROUP_MEMBERS,
+                             e.err_code)
+
+    def test_validate_no_group_cycles_with_many_groups(self):
+        groups_count = 1000
+        scaling_groups = dict(
+            ('group{0}'.format(i),
+             {'members': ['group{0}'.format((i + 1) % groups_count)]})
+            for i in range(groups_count))
+        try:
+            policies.Policies(context=None, initial_value={}).\
+                _validate_and_update_groups(scaling_groups, [])
+            self.fail()
+        except exceptions.DSLParsingLogicException as e:
+            self.assertEqual(exceptions.ERROR_GROUP_CYCLE, e.err_code)
+
     def test_validate_policies_spec_version(self):
         nodes = {
             'node': None
@@ -13,8 +13,14 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
+import collections
+
+from mock import patch
+
 from dsl_parser.tests.abstract_test_parser import AbstractTestParser
 from dsl_parser import exceptions
+from dsl_parser import utils
+from dsl_parser.elements import types
 from dsl_parser.exceptions import DSLParsingLogicException
 
 
@@ -705,3 +711,148 @@ node_templates:
         properties = self.parse_1_2(yaml)['nodes'][0]['properties']
         self.assertEqual(properties['prop1']['prop1'], 'value1')
         self.assertEqual(properties['prop2']['prop2'], 'value2')
+
+    def test_resolved_types_reused_across_parses(self):
+        yaml = """
+data_types:
+    data1:
+        properties:
+            prop1:
+                default: {0}
+node_types:
+    base:
+        properties:
+            prop1:
+                type: data1
+    type:
+        derived_from: base
+node_templates:
+    node:
+        type: type
+"""
+        with patch.object(types, 'RESOLVED_TYPES_CACHE_SIZE', 100), \
+                patch.object(types, '_resolved_types',
+                             collections.OrderedDict()):
+            self._assert_resolved_types_reused(yaml)
+
+    def _assert_resolved_types_reused(self, yaml):
+        self.parse_1_2(yaml.format('value1'))
+        with patch('dsl_parser.utils.merge_schemas',
+                   wraps=utils.merge_schemas) as merge_schemas:
+            properties = self.parse_1_2(
+                yaml.format('value1'))['nodes'][0]['properties']
+            self.assertFalse(merge_schemas.called)
+            self.assertEqual(properties['prop1']['prop1'], 'value1')
+            properties = self.parse_1_2(
+                yaml.format('value2'))['nodes'][0]['properties']
+            self.assertTrue(merge_schemas.called)
+            self.assertEqual(properties['prop1']['prop1'], 'value2')
+
+    def test_nested_defaults_merged_per_node(self):
+        yaml = """
+data_types:
+    pair_type:
+        properties:
+            first:
+                type: integer
+                default: 1
+            second:
+                default: [1, 2]
+node_types:
+    type:
+        properties:
+            pair:
+                type: pair_type
+                default:
+                    first: 2
+node_templates:
+    node1:
+        type: type
+    node2:
+        type: type
+        properties:
+            pair:
+                second: [3]
+"""
+        nodes = dict((node['name'], node) for node in
+                     self.parse_1_2(yaml)['nodes'])
+        pair1 = nodes['node1']['properties']['pair']
+        pair2 = nodes['node2']['properties']['pair']
+        self.assertEqual({'first': 2, 'second': [1, 2]}, pair1)
+        self.assertEqual({'first': 2, 'second': [3]}, pair2)
+
+    def test_resolved_types_keys_keep_value_types(self):
+        yaml = """
+node_types:
+    type:
+        properties:
+            prop1:
+                default: {0}
+node_templates:
+    node:
+        type: type
+"""
+        with patch.object(types, 'RESOLVED_TYPES_CACHE_SIZE', 100), \
+                patch.object(types, '_resolved_types',
+                             collections.OrderedDict()):
+            for default, expected in [("{1: a}", {1: 'a'}),
+                                      ("{'1': a}", {'1': 'a'}),
+                                      ('1', 1),
+                                      ('true', True)]:
+                properties = self.parse_1_2(
+                    yaml.format(default))['nodes'][0]['properties']
+                self.assertEqual(expected, properties['prop1'])
+                self.assertIs(type(expected), type(properties['prop1']))
+
+    def test_property_schemas_compiled_once_per_parse(self):
+        yaml = """
+data_types:
+    pair_type:
+        properties:
+            first:
+                type: integer
+                default: 1
+node_types:
+    type:
+        properties:
+            pair:
+                type: pair_type
+                default: {}
+node_templates:
+    node1:
+        type: type
+    node2:
+        type: type
+    node3:
+        type: type
+policy_types:
+    policy_type:
+        source: source
+        properties:
+            pair:
+                type: pair_type
+groups:
+    group:
+        members: [node1]
+        policies:
+            policy1:
+                type: policy_type
+                properties:
+                    pair: {}
+            policy2:
+                type: policy_type
+                properties:
+                    pair: {}
+"""
+
+        def compiled_per_parse():
+            with patch.object(utils, '_CompiledSchema',
+                              wraps=utils._CompiledSchema) as compiled:
+                self.parse_1_2(yaml)
+            return len([args for args, _ in compiled.call_args_list
+                        if args[2] is not None])
+        # the node type and the policy type schemas, and the data type
+        # schema once for the node templates and once for the policies
+        self.assertEqual(4, compiled_per_parse())
+        # nothing is kept between parses
+        self.assertEqual(4, compiled_per_parse())
@@ -313,3 +313,59 @@ class TestSchemaValidation(testtools.TestCase):
             {'child': 'value'},
             TestElement,
             error_code=exceptions.ERROR_CODE_ILLEGAL_VALUE_ACCESS)
+
+    def test_shared_value(self):
+        received = {}
+
+        class Source(elements.Element):
+            schema = elements.Leaf(type=dict)
+
+        def consumer(name, shared):
+            class Consumer(elements.Element):
+                schema = elements.Leaf(type=str)
+                requires = {
+                    Source: [requirements.Value('source', shared=shared)]
+                }
+
+                def parse(self, source):
+                    received.setdefault(name, []).append(source)
+                    return self.initial_value
+            return Consumer
+
+        class TestElement(elements.Element):
+            schema = {
+                'source': Source,
+                'shared1': consumer('shared', shared=True),
+                'shared2': consumer('shared', shared=True),
+                'copied': consumer('copied', shared=False)
+            }
+
+        parser.parse(value={'source': {'key': ['value']},
+                            'shared1': 'a',
+                            'shared2': 'b',
+                            'copied': 'c'},
+                     element_cls=TestElement)
+        shared1, shared2 = received['shared']
+        copied, = received['copied']
+        self.assertIs(shared1, shared2)
+        self.assertEqual(shared1, copied)
+        self.assertIsNot(shared1, copied)
+
+    def test_initial_value_keys(self):
+        class ChildElement(elements.Element):
+            schema = elements.Leaf(type=str)
+
+            def validate(self):
+                names = self.ancestor(TestElement).initial_value_keys
+                if self.initial_value not in names:
+                    raise exceptions.DSLParsingLogicException(
+                        1, 'unknown name')
+                if names is not self.ancestor(TestElement).initial_value_keys:
+                    raise exceptions.DSLParsingLogicException(
+                        2, 'keys computed twice')
+
+        class TestElement(elements.Element):
+            schema = elements.Dict(type=ChildElement)
+
+        self.assert_valid({'a': 'b', 'b': 'a'}, TestElement)
+        self.assert_invalid({'a': 'c'}, TestElement)
@@ -16,6 +16,8 @@
 from testtools import ExpectedException
 
 from dsl_parser import exceptions
+from dsl_parser import functions
+from dsl_parser import scan
 from dsl_parser.tasks import prepare_deployment_plan
 from dsl_parser.tests.abstract_test_parser import AbstractTestParser
 from dsl_parser.tests.abstract_test_parser import timeout
@@ -855,6 +857,32 @@ outputs:
         assert_with('SOURCE')
         assert_with('TARGET')
 
+    def test_invalid_arguments_in_policy_property(self):
+        yaml = """
+node_types:
+    vm_type: {}
+node_templates:
+    vm:
+        type: vm_type
+policy_types:
+    policy_type:
+        source: source
+        properties:
+            key:
+                type: string
+groups:
+    group:
+        members: [vm]
+        policies:
+            policy:
+                type: policy_type
+                properties:
+                    key: { get_attribute: [only_one] }
+"""
+        with ExpectedException(ValueError,
+                               '.*Illegal arguments.*get_attribute.*'):
+            self.parse(yaml)
+
 
 class TestConcat(AbstractTestParser):
 
@@ -1137,3 +1165,64 @@ outputs:
                          ['one', 'value', {'get_attribute': ['node',
                                                              'attribute']}]},
                          outputs['output3']['value'])
+
+
+class TestScanProperties(AbstractTestParser):
+
+    def test_scan_paths_and_order(self):
+        properties = {'a': [1, {'b': 2}]}
+        scanned = []
+
+        def handler(value, scope, context, path):
+            scanned.append((path, value))
+            return value
+
+        scan.scan_properties(properties, handler, path='props')
+        self.assertEqual([
+            ('props.a', [1, {'b': 2}]),
+            ('props.a[0]', 1),
+            ('props.a[1]', {'b': 2}),
+            ('props.a.b', 2)
+        ], scanned)
+
+    def test_scan_value_filter(self):
+        get_input = {'get_input': 'x'}
+        properties = {'a': {'b': [{'c': get_input}, 'not_a_function']}}
+        scanned = []
+
+        def handler(value, scope, context, path):
+            scanned.append(path)
+            return 'replaced'
+
+        scan.scan_properties(properties,
+                             handler,
+                             path='props',
+                             replace=True,
+                             value_filter=functions.is_function)
+        self.assertEqual(['props.a.b.c'], scanned)
+        self.assertEqual({'a': {'b': [{'c': 'replaced'}, 'not_a_function']}},
+                         properties)
+
+    def test_scan_replaced_values_not_scanned(self):
+        properties = {'a': {'b': [1, 2]}, 'c': {'d': 3}}
+        scanned = []
+
+        def handler(value, scope, context, path):
+            scanned.append(path)
+            return {'replaced': True} if path == 'props.a' else value
+
+        scan.scan_properties(properties, handler, path='props', replace=True)
+        self.assertEqual(['props.a', 'props.c', 'props.c.d'], sorted(scanned))
+        self.assertEqual({'a': {'replaced': True}, 'c': {'d': 3}}, properties)
+
+    def test_scan_deeply_nested(self):
+        properties = current = {}
+        for _ in range(5000):
+            current['nested'] = {}
+            current = current['nested']
+        current['leaf'] = {'get_input': 'x'}
+        scanned = []
+        scan.scan_properties(properties,
+                             lambda value, *args: scanned.append(value),
+                             value_filter=functions.is_function)
+        self.assertEqual([{'get_input': 'x'}], scanned)
@@ -14,6 +14,8 @@
 #    * limitations under the License.
 
 import collections
+import threading
+import time
 
 import testtools.testcase
 
@@ -368,6 +370,105 @@ class TestEvaluateFunctions(AbstractTestParser):
 
         self.assertEqual(payload['a'], 'value6_{0}'.format(index))
 
+    def test_runtime_storage_scaling_groups_index(self):
+        node_instances = {
+            'host_1': NodeInstance({
+                'id': 'host_1',
+                'node_id': 'host',
+                'scaling_groups': [{'name': 'g1', 'id': 'g1_1'}]
+            }),
+            'app_1': NodeInstance({
+                'id': 'app_1',
+                'node_id': 'app',
+                'scaling_groups': [{'name': 'g2', 'id': 'g2_1'}],
+                'relationships': [{'target_name': 'host',
+                                   'target_id': 'host_1'}]
+            })
+        }
+        nodes = {
+            'host': Node({'id': 'host'}),
+            'app': Node({
+                'id': 'app',
+                'relationships': [{
+                    'target_id': 'host',
+                    'type_hierarchy': [constants.CONTAINED_IN_REL_TYPE]}]
+            })
+        }
+        get_node_calls = []
+
+        def get_node(node_id):
+            get_node_calls.append(node_id)
+            return nodes[node_id]
+
+        storage = functions.RuntimeEvaluationStorage(
+            get_node_instances_method=None,
+            get_node_instance_method=lambda i: node_instances[i],
+            get_node_method=get_node)
+        app_1 = node_instances['app_1']
+        self.assertIs(node_instances['host_1'],
+                      storage.get_parent_node_instance(app_1))
+        self.assertIsNone(storage.get_parent_node_instance(
+            node_instances['host_1']))
+        for _ in range(3):
+            group_names, group_ids = storage.get_scaling_groups_index(app_1)
+            self.assertEqual(['g2', 'g1'], group_names)
+            self.assertEqual({'g1': 'g1_1', 'g2': 'g2_1'}, group_ids)
+        self.assertEqual(['app', 'host'], get_node_calls)
+
+    def test_evaluate_functions_concurrent_fetches(self):
+        lock = threading.Lock()
+        in_flight = [0]
+        max_in_flight = [0]
+        calls = collections.defaultdict(int)
+
+        def fetch(key, result):
+            with lock:
+                calls[key] += 1
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            time.sleep(0.05)
+            with lock:
+                in_flight[0] -= 1
+            return result
+
+        def get_node_instance(node_instance_id):
+            return fetch(('node_instance', node_instance_id), NodeInstance({
+                'id': node_instance_id,
+                'node_id': node_instance_id,
+                'runtime_properties': {'key': node_instance_id}
+            }))
+
+        def get_node_instances(node_id):
+            return fetch(('node_instances', node_id), [NodeInstance({
+                'id': node_id,
+                'node_id': node_id,
+                'runtime_properties': {'key': node_id}
+            })])
+
+        def get_node(node_id):
+            return fetch(('node', node_id), Node({'id': node_id}))
+
+        payload = dict(
+            ('a{0}'.format(i), {'get_attribute': ['node{0}'.format(i), 'key']})
+            for i in range(10))
+        payload['self'] = {'get_attribute': ['SELF', 'key']}
+        payload['concat'] = {'concat': [
+            {'get_attribute': ['node0', 'key']},
+            {'get_attribute': ['TARGET', 'key']}]}
+        functions.evaluate_functions(payload,
+                                     {'self': 'self_1', 'target': 'target_1'},
+                                     get_node_instances,
+                                     get_node_instance,
+                                     get_node,
+                                     max_concurrent_fetches=10)
+
+        for i in range(10):
+            self.assertEqual('node{0}'.format(i), payload['a{0}'.format(i)])
+        self.assertEqual('self_1', payload['self'])
+        self.assertEqual('node0target_1', payload['concat'])
+        self.assertTrue(max_in_flight[0] > 1)
+        self.assertEqual(set([1]), set(calls.values()))
+
     def test_process_attributes_properties_fallback(self):
 
         def get_node_instances(node_id=None):
@@ -388,6 +388,42 @@ node_templates:
 """
         self.assertRaises(UnknownInputError, self.parse, yaml)
 
+    def test_invalid_get_input_in_data_type_default(self):
+        yaml = """
+data_types:
+    data_type:
+        properties:
+            port:
+                type: string
+                default: { get_input: [1, 2] }
+node_types:
+    webserver_type:
+        properties:
+            endpoint:
+                type: data_type
+node_templates:
+    webserver:
+        type: webserver_type
+"""
+        self.assertRaises(ValueError, self.parse_1_2, yaml)
+
+    def test_invalid_get_input_in_workflow_parameter_default(self):
+        yaml = self.BASIC_PLUGIN + """
+node_types:
+    webserver_type: {}
+node_templates:
+    webserver:
+        type: webserver_type
+workflows:
+    workflow:
+        mapping: test_plugin.workflow
+        parameters:
+            port:
+                type: string
+                default: { get_input: [1, 2] }
+"""
+        self.assertRaises(ValueError, self.parse, yaml)
+
     def test_input_in_outputs(self):
         yaml = """
 inputs:
@@ -20,13 +20,17 @@ import yaml as yml
 from urllib2 import HTTPError
 from urllib import pathname2url
 
+from mock import patch
+
 from dsl_parser import exceptions
 from dsl_parser import constants
 from dsl_parser import version
 from dsl_parser import models
+from dsl_parser.elements import workflows
 from dsl_parser.tests.abstract_test_parser import AbstractTestParser
 from dsl_parser.parser import parse_from_path, parse_from_url
 from dsl_parser.parser import parse as dsl_parse
+from dsl_parser.tasks import prepare_deployment_plan
 from dsl_parser.interfaces.constants import NO_OP
 from dsl_parser.interfaces.utils import operation_mapping
 from dsl_parser.constants import TYPE_HIERARCHY
@@ -404,6 +408,25 @@ node_types:
         node = result['nodes'][0]
         self.assertEquals('val2', node['properties']['key2'])
 
+    def test_node_type_property_defaults_not_shared_between_nodes(self):
+        yaml = self.BASIC_NODE_TEMPLATES_SECTION + """
+    test_node2:
+        type: test_type
+node_types:
+    test_type:
+        properties:
+            key:
+                default: "not_val"
+            list_key:
+                default: [1, 2]
+    """
+        result = self.parse(yaml)
+        node1, node2 = result['nodes']
+        self.assertEqual(node1['properties']['list_key'],
+                         node2['properties']['list_key'])
+        self.assertIsNot(node1['properties']['list_key'],
+                         node2['properties']['list_key'])
+
     def test_type_properties_empty_properties(self):
         yaml = """
 node_templates:
@@ -2180,6 +2203,27 @@ workflows:
         self.assertEqual(1, len(workflow_plugins_to_install))
         self.assertEqual('test_plugin', workflow_plugins_to_install[0]['name'])
 
+    def test_workflow_plugins_not_shared_with_plugins(self):
+        yaml = self.BLUEPRINT_WITH_INTERFACES_AND_PLUGINS + """
+workflows:
+    workflow1: test_plugin.workflow1
+"""
+        calculate_provided = workflows.Workflows.calculate_provided
+        calls = []
+
+        def calculate_provided_spy(element, plugins):
+            provided = calculate_provided(element, plugins)
+            calls.append((plugins, provided))
+            return provided
+
+        with patch.object(workflows.Workflows, 'calculate_provided',
+                          calculate_provided_spy):
+            self.parse(yaml)
+        plugins, provided = calls[0]
+        workflow_plugin = provided['workflow_plugins_to_install'][0]
+        self.assertEqual(plugins['test_plugin'], workflow_plugin)
+        self.assertIsNot(plugins['test_plugin'], workflow_plugin)
+
     def test_workflow_advanced_mapping(self):
         yaml = self.BLUEPRINT_WITH_INTERFACES_AND_PLUGINS + """
 workflows:
@@ -2671,6 +2715,231 @@ node_types:
         result = self.parse(yaml)
         self._assert_blueprint(result)
 
+    def test_operation_mapping_with_dotted_plugin_name(self):
+        yaml = self.BASIC_NODE_TEMPLATES_SECTION + """
+        interfaces:
+            test_interface1:
+                install: one.two.three.install
+node_types:
+    test_type:
+        properties:
+            key: {}
+plugins:
+    one.three:
+        executor: central_deployment_agent
+        source: dummy
+    one.two:
+        executor: central_deployment_agent
+        source: dummy
+"""
+        node = self.parse(yaml)['nodes'][0]
+        operation = node['operations']['test_interface1.install']
+        self.assertEqual('one.two', operation['plugin'])
+        self.assertEqual('three.install', operation['operation'])
+
+    def test_node_templates_of_same_type_share_processed_operations(self):
+        yaml = """
+node_templates:
+    node1:
+        type: test_type
+    node2:
+        type: test_type
+    node3:
+        type: test_type
+        interfaces:
+            test_interface:
+                install:
+                    implementation: test_plugin.other_install
+node_types:
+    test_type:
+        interfaces:
+            test_interface:
+                install:
+                    implementation: test_plugin.install
+                    inputs:
+                        key:
+                            default: value
+""" + self.BASIC_PLUGIN
+        nodes = dict((node['id'], node) for node in
+                     self.parse(yaml)['nodes'])
+        node1, node2, node3 = nodes['node1'], nodes['node2'], nodes['node3']
+        self.assertEqual(node1['operations'], node2['operations'])
+        self.assertEqual(node1['interfaces'], node2['interfaces'])
+        self.assertIsNot(node1['operations']['install'],
+                         node2['operations']['install'])
+        self.assertIsNot(node1['interfaces'], node2['interfaces'])
+        self.assertEqual('install',
+                         node1['operations']['install']['operation'])
+        self.assertEqual('other_install',
+                         node3['operations']['install']['operation'])
+
+    def test_node_templates_with_equal_looking_interfaces(self):
+        yaml = """
+node_templates:
+    node1:
+        type: test_type
+        interfaces:
+            test_interface:
+                install:
+                    implementation: test_plugin.install
+                    inputs:
+                        key: {1: value}
+    node2:
+        type: test_type
+        interfaces:
+            test_interface:
+                install:
+                    implementation: test_plugin.install
+                    inputs:
+                        key: {'1': value}
+    node3:
+        type: test_type
+        interfaces:
+            test_interface:
+                install:
+                    implementation: test_plugin.install
+                    inputs:
+                        key: true
+    node4:
+        type: test_type
+        interfaces:
+            test_interface:
+                install:
+                    implementation: test_plugin.install
+                    inputs:
+                        key: 1
+node_types:
+    test_type: {}
+""" + self.BASIC_PLUGIN
+        nodes = dict((node['id'], node) for node in
+                     self.parse(yaml)['nodes'])
+        self.assertEqual({1: 'value'},
+                         nodes['node1']['operations']['install']['inputs'][
+                             'key'])
+        self.assertEqual({'1': 'value'},
+                         nodes['node2']['operations']['install']['inputs'][
+                             'key'])
+        self.assertIs(True,
+                      nodes['node3']['operations']['install']['inputs'][
+                          'key'])
+        self.assertIs(1,
+                      nodes['node4']['operations']['install']['inputs'][
+                          'key'])
+        self.assertEqual({'1': 'value'},
+                         nodes['node2']['interfaces']['test_interface'][
+                             'install']['inputs']['key'])
+
+    def test_compact_plan(self):
+        yaml = """
+node_templates:
+    node1:
+        type: test_type
+        properties:
+            key: value1
+        interfaces: &interfaces
+            test_interface:
+                start:
+                    implementation: test_plugin.start
+                    inputs:
+                        key: { get_property: [SELF, key] }
+        relationships:
+            - type: test_relationship
+              target: node3
+    node2:
+        type: test_type
+        properties:
+            key: value2
+        interfaces: *interfaces
+        relationships:
+            - type: test_relationship
+              target: node3
+    node3:
+        type: test_type
+        properties:
+            key: value3
+node_types:
+    test_type:
+        properties:
+            key: {}
+        interfaces:
+            test_interface:
+                install: test_plugin.install
+relationships:
+    cloudify.relationships.depends_on:
+        properties:
+            connection_type:
+                default: all_to_all
+    test_relationship:
+        derived_from: cloudify.relationships.depends_on
+        source_interfaces:
+            test_interface:
+                establish: test_plugin.establish
+""" + self.BASIC_PLUGIN
+        plan = self.parse(yaml)
+        compact_plan = self.parse(yaml, compact_plan=True)
+        self.assertEqual(plan, compact_plan)
+
+        def assert_shared(plan):
+            nodes = dict((node['id'], node) for node in plan['nodes'])
+            node1, node2 = nodes['node1'], nodes['node2']
+            self.assertIs(node1[TYPE_HIERARCHY], node2[TYPE_HIERARCHY])
+            self.assertIs(node1['operations']['install'],
+                          node2['operations']['install'])
+            self.assertIs(node1['operations']['install'],
+                          node1['operations']['test_interface.install'])
+            self.assertIs(node1['plugins'][0], node2['plugins'][0])
+            relationship1 = node1['relationships'][0]
+            relationship2 = node2['relationships'][0]
+            self.assertIs(relationship1[TYPE_HIERARCHY],
+                          relationship2[TYPE_HIERARCHY])
+            self.assertIs(relationship1[TYPE_HIERARCHY],
+                          plan['relationships']['test_relationship'][
+                              TYPE_HIERARCHY])
+            self.assertIs(relationship1['source_operations']['establish'],
+                          relationship2['source_operations']['establish'])
+            # operations with intrinsic functions are evaluated per node
+            self.assertIsNot(node1['operations']['start'],
+                             node2['operations']['start'])
+            return node1, node2
+
+        assert_shared(compact_plan)
+        node1, node2 = assert_shared(prepare_deployment_plan(compact_plan))
+        self.assertEqual('value1',
+                         node1['operations']['start']['inputs']['key'])
+        self.assertEqual('value2',
+                         node2['operations']['start']['inputs']['key'])
+
+    def test_compact_plan_keys_keep_their_types(self):
+        yaml = """
+node_templates:
+    node1:
+        type: test_type
+        interfaces:
+            test_interface:
+                start:
+                    implementation: test_plugin.start
+                    inputs:
+                        1: value
+    node2:
+        type: test_type
+        interfaces:
+            test_interface:
+                start:
+                    implementation: test_plugin.start
+                    inputs:
+                        true: value
+node_types:
+    test_type: {}
+""" + self.BASIC_PLUGIN
+        plan = self.parse(yaml)
+        compact_plan = self.parse(yaml, compact_plan=True)
+        self.assertEqual(plan, compact_plan)
+        nodes = dict((node['id'], node) for node in compact_plan['nodes'])
+        for node_id, key in [('node1', 1), ('node2', True)]:
+            inputs = nodes[node_id]['operations']['start']['inputs']
+            self.assertEqual({key: 'value'}, inputs)
+            self.assertIs(type(key), type(inputs.keys()[0]))
+
     def test_property_schema_type_property_with_intrinsic_functions(self):
         yaml = """
 node_templates:
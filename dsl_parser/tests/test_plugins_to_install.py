@@ -15,6 +15,7 @@
 
 
 from dsl_parser import constants
+from dsl_parser.elements.node_templates import _process_nodes_plugins
 from dsl_parser.tests.test_parser_api import op_struct
 from dsl_parser.tests.abstract_test_parser import AbstractTestParser
 
@@ -480,3 +481,52 @@ plugins:
         deployment_plugins_to_install_for_plan = \
             result[constants.DEPLOYMENT_PLUGINS_TO_INSTALL]
         self.assertEquals(1, len(deployment_plugins_to_install_for_plan))
+
+    def test_plugins_to_install_with_many_hosts(self):
+        hosts_count = 2000
+        plugins = {
+            'test_plugin': {
+                'name': 'test_plugin',
+                'executor': constants.HOST_AGENT
+            },
+            'test_management_plugin': {
+                'name': 'test_management_plugin',
+                'executor': constants.CENTRAL_DEPLOYMENT_AGENT
+            }
+        }
+        start = op_struct('test_plugin', 'start',
+                          executor=constants.HOST_AGENT)
+        create = op_struct('test_management_plugin', 'create',
+                           executor=constants.CENTRAL_DEPLOYMENT_AGENT)
+        nodes = {}
+        for i in range(hosts_count):
+            host_id = 'host{0}'.format(i)
+            app_id = 'app{0}'.format(i)
+            nodes[host_id] = {
+                'id': host_id,
+                'type': 'host_type',
+                'host_id': host_id,
+                'operations': {},
+                'relationships': []
+            }
+            nodes[app_id] = {
+                'id': app_id,
+                'type': 'app_type',
+                'host_id': host_id,
+                'operations': {'start': start, 'create': create},
+                'relationships': []
+            }
+        _process_nodes_plugins(processed_nodes=nodes,
+                               host_types=['host_type'],
+                               plugins=plugins)
+        host_plugin = nodes['host0']['plugins_to_install'][0]
+        for i in range(hosts_count):
+            host = nodes['host{0}'.format(i)]
+            self.assertEquals(1, len(host['plugins_to_install']))
+            plugin = host['plugins_to_install'][0]
+            self.assertEquals('test_plugin', plugin['name'])
+            # plugin records are shared between nodes
+            self.assertIs(host_plugin, plugin)
+            app = nodes['app{0}'.format(i)]
+            self.assertNotIn('plugins_to_install', app)
+            self.assertEquals(1, len(app['deployment_plugins_to_install']))
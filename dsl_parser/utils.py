@@ -74,13 +74,28 @@ def merge_schemas(overridden_schema,
 
 
 def flatten_schema(schema):
+    # defaults are copied, since schemas may be shared between the elements
+    # requiring them (see framework.requirements.Value), and the defaults
+    # end up in the values of these elements
     flattened_schema_props = {}
     for prop_key, prop in schema.iteritems():
         if 'default' in prop:
-            flattened_schema_props[prop_key] = prop['default']
+            flattened_schema_props[prop_key] = copy.deepcopy(prop['default'])
     return flattened_schema_props
 
 
+def freeze(value):
+    """A hashable form of a parsed (yaml) value, equal for equal values
+    only. Scalars keep their type, so that e.g. 1, '1' and True (or a date
+    and its string form) do not collide."""
+    if isinstance(value, dict):
+        return dict, frozenset((freeze(key), freeze(item))
+                               for key, item in value.iteritems())
+    if isinstance(value, list):
+        return list, tuple(freeze(item) for item in value)
+    return type(value), value
+
+
 def _property_description(path, name=None):
     if not path:
         return name
@@ -98,74 +113,121 @@ def merge_schema_and_instance_properties(
         missing_property_error_message,
         node_name,
         path=None,
-        raise_on_missing_property=True):
-    flattened_schema_props = flatten_schema(schema_properties)
-    return _merge_flattened_schema_and_instance_properties(
+        raise_on_missing_property=True,
+        compiled_schemas=None):
+    return _compiled_schema(
+        schema_properties, data_types, compiled_schemas).merge(
         instance_properties=instance_properties,
-        schema_properties=schema_properties,
-        flattened_schema_properties=flattened_schema_props,
-        data_types=data_types,
+        derived_values=None,
         undefined_property_error_message=undefined_property_error_message,
         missing_property_error_message=missing_property_error_message,
         node_name=node_name,
-        path=path,
+        path=path or [],
         raise_on_missing_property=raise_on_missing_property)
 
 
-def _merge_flattened_schema_and_instance_properties(
-        instance_properties,
-        schema_properties,
-        flattened_schema_properties,
-        data_types,
-        undefined_property_error_message,
-        missing_property_error_message,
-        node_name,
-        path,
-        raise_on_missing_property):
-    path = path or []
-
-    # validate instance properties don't
-    # contain properties that are not defined
-    # in the schema.
-    for key in instance_properties.iterkeys():
-        if key not in schema_properties:
-            ex = DSLParsingLogicException(
-                106,
-                undefined_property_error_message.format(
-                    node_name,
-                    _property_description(path, key)))
-            ex.property = key
-            raise ex
-
-    merged_properties = dict(flattened_schema_properties.items() +
-                             instance_properties.items())
-    result = {}
-    for key, property_schema in schema_properties.iteritems():
-        if key not in merged_properties:
-            required = property_schema.get('required', True)
-            if required and raise_on_missing_property:
+def _compiled_schema(schema_properties, data_types, compiled_schemas):
+    # compiled_schemas is owned by the caller (e.g. the element parsing all
+    # node templates) and lives as long as it does. Compiled schemas are
+    # stored by the ids of the schema and data types they were compiled
+    # for; both are referenced by the compiled schema, so their ids are not
+    # reused while it is stored, and being shared between elements (see
+    # framework.requirements.Value) they are not modified either.
+    if compiled_schemas is None:
+        return _CompiledSchema(schema_properties, data_types, None)
+    key = (id(schema_properties), id(data_types))
+    compiled = compiled_schemas.get(key)
+    if compiled is None:
+        compiled = _CompiledSchema(
+            schema_properties, data_types, compiled_schemas)
+        compiled_schemas[key] = compiled
+    return compiled
+
+
+_IMMUTABLE_TYPES = (basestring, bool, int, long, float, type(None))
+
+
+class _CompiledSchema(object):
+    """A properties schema prepared once for merging and validating the
+    properties of all instances using it (e.g. all nodes of a type)."""
+
+    def __init__(self, schema_properties, data_types, compiled_schemas):
+        self.schema_properties = schema_properties
+        self.data_types = data_types
+        self.compiled_schemas = compiled_schemas
+        self.properties = [
+            (key,
+             prop.get('type'),
+             prop.get('required', True),
+             'default' in prop,
+             prop.get('default'),
+             not isinstance(prop.get('default'), _IMMUTABLE_TYPES))
+            for key, prop in schema_properties.iteritems()]
+
+    def merge(self,
+              instance_properties,
+              derived_values,
+              undefined_property_error_message,
+              missing_property_error_message,
+              node_name,
+              path,
+              raise_on_missing_property):
+        # validate instance properties don't
+        # contain properties that are not defined
+        # in the schema.
+        for key in instance_properties.iterkeys():
+            if key not in self.schema_properties:
                 ex = DSLParsingLogicException(
-                    107,
-                    missing_property_error_message.format(
+                    106,
+                    undefined_property_error_message.format(
                         node_name,
                         _property_description(path, key)))
                 ex.property = key
                 raise ex
+
+        if not isinstance(derived_values, dict):
+            derived_values = {}
+        result = {}
+        for key, type_name, required, has_default, default, mutable in \
+                self.properties:
+            # mutable defaults are copied, since they end up in the result
+            if key in derived_values:
+                derived_value = derived_values[key]
+            elif not mutable:
+                derived_value = default
+            elif has_default and (key not in instance_properties or
+                                  type_name in self.data_types):
+                derived_value = copy.deepcopy(default)
+            else:
+                derived_value = None
+            if key in instance_properties:
+                value = instance_properties[key]
+            elif key in derived_values or has_default:
+                value = derived_value
             else:
+                if required and raise_on_missing_property:
+                    ex = DSLParsingLogicException(
+                        107,
+                        missing_property_error_message.format(
+                            node_name,
+                            _property_description(path, key)))
+                    ex.property = key
+                    raise ex
                 continue
-        prop_path = copy.copy(path)
-        prop_path.append(key)
-        result[key] = parse_value(
-            value=merged_properties.get(key),
-            derived_value=flattened_schema_properties.get(key),
-            type_name=property_schema.get('type'),
-            data_types=data_types,
-            undefined_property_error_message=undefined_property_error_message,
-            missing_property_error_message=missing_property_error_message,
-            node_name=node_name,
-            path=prop_path,
-            raise_on_missing_property=raise_on_missing_property)
-    return result
+            result[key] = _parse_value(
+                value=value,
+                derived_value=derived_value,
+                type_name=type_name,
+                data_types=self.data_types,
+                undefined_property_error_message=(
+                    undefined_property_error_message),
+                missing_property_error_message=missing_property_error_message,
+                node_name=node_name,
+                path=path,
+                key=key,
+                raise_on_missing_property=raise_on_missing_property,
+                compiled_schemas=self.compiled_schemas)
+        return result
 
 
 def parse_value(
@@ -178,10 +240,39 @@ def parse_value(
         path,
         derived_value=None,
         raise_on_missing_property=True):
+    return _parse_value(
+        value=value,
+        derived_value=derived_value,
+        type_name=type_name,
+        data_types=data_types,
+        undefined_property_error_message=undefined_property_error_message,
+        missing_property_error_message=missing_property_error_message,
+        node_name=node_name,
+        path=path,
+        key=None,
+        raise_on_missing_property=raise_on_missing_property,
+        compiled_schemas=None)
+
+
+def _parse_value(
+        value,
+        derived_value,
+        type_name,
+        data_types,
+        undefined_property_error_message,
+        missing_property_error_message,
+        node_name,
+        path,
+        key,
+        raise_on_missing_property,
+        compiled_schemas):
+    # the value is the one of path + [key]; the list is only built when
+    # needed, i.e. for nested data types and errors
     if type_name is None:
         return value
-    if functions.parse(value) != value:
-        # intrinsic function - not validated at the moment
+    if functions.is_function(value):
+        # intrinsic function - only its arguments are validated
+        functions.parse(value)
         return value
     if type_name == 'integer':
         if isinstance(value, (int, long)) and not isinstance(
@@ -199,25 +290,21 @@ def parse_value(
     elif type_name in data_types:
         if isinstance(value, dict):
             data_schema = data_types[type_name]['properties']
-            flattened_data_schema = flatten_schema(data_schema)
-            if isinstance(derived_value, dict):
-                flattened_data_schema.update(derived_value)
             undef_msg = undefined_property_error_message
-            return _merge_flattened_schema_and_instance_properties(
+            return _compiled_schema(
+                data_schema, data_types, compiled_schemas).merge(
                 instance_properties=value,
-                schema_properties=data_schema,
-                flattened_schema_properties=flattened_data_schema,
-                data_types=data_types,
+                derived_values=derived_value,
                 undefined_property_error_message=undef_msg,
                 missing_property_error_message=missing_property_error_message,
                 node_name=node_name,
-                path=path,
+                path=path if key is None else path + [key],
                 raise_on_missing_property=raise_on_missing_property)
     else:
         raise RuntimeError(
             "Unexpected type defined in property schema for property '{0}'"
             " - unknown type is '{1}'".format(
-                _property_description(path),
+                _property_description(path, key),
                 type_name))
 
     raise DSLParsingLogicException(
@@ -226,7 +313,7 @@ def parse_value(
         "'{1}' type is '{2}', yet it was assigned with the "
         "value '{3}'".format(
             node_name,
-            _property_description(path),
+            _property_description(path, key),
             type_name,
             value))
 